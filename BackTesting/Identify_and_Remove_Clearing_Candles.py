@@ -1,82 +1,313 @@
+import numpy as np
 import pandas as pd
+import hashlib
+import json
+import logging
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import instrumentation
+from instrumentation import configure_logging, count, log_reports, stage
+from price_cache import iter_prices, load_prices, ticker_from_path
+
+# Bollinger Band parameters: 50-period moving average, 3 standard deviations,
+# checked only for candles between 8:00 am and 8:30 am
+WINDOW = 50
+NUM_STD = 3
+CHECK_START = '08:00'
+CHECK_END = '08:30'
+BAND_PARAMS = {'window': WINDOW, 'num_std': NUM_STD, 'check_start': CHECK_START, 'check_end': CHECK_END}
+
+ANALYSIS_COLUMNS = ['datetime', 'open', 'high', 'low', 'close', 'moving_avg', 'upper_band', 'lower_band']
+
+logger = logging.getLogger(__name__)
+
+
+def rolling_mean_std(closes, window=WINDOW):
+    # Mean and sample standard deviation of the last `window` closes at every row
+    # (fewer at the very start, like pandas' min_periods=1).  Each value is
+    # computed from its own window only, so it is the same whether the series is
+    # processed whole or in chunks.
+    x = np.asarray(closes, dtype=float)
+    n = len(x)
+    counts = np.minimum(np.arange(1, n + 1), window)
+    total = np.zeros(n)
+    for lag in range(min(window, n)):
+        total[lag:] += x[:n - lag]
+    mean = total / counts
+    squares = np.zeros(n)
+    for lag in range(min(window, n)):
+        deviation = x[:n - lag] - mean[lag:]
+        squares[lag:] += deviation * deviation
+    with np.errstate(invalid='ignore', divide='ignore'):
+        std = np.sqrt(squares / (counts - 1))
+    std[counts == 1] = np.nan
+    return mean, std
+
+
+def add_bollinger_bands(df, history=None):
+    # Add moving_avg, std_dev, upper_band and lower_band columns.  `history` holds
+    # the closes just before `df` (at most WINDOW - 1) when processing in chunks.
+    closes = df['close'].to_numpy()
+    if history is not None and len(history):
+        closes = np.concatenate([history, closes])
+    mean, std = rolling_mean_std(closes)
+    skip = len(closes) - len(df)
+    df['moving_avg'] = mean[skip:]
+    df['std_dev'] = std[skip:]
+    df['upper_band'] = df['moving_avg'] + (NUM_STD * df['std_dev'])
+    df['lower_band'] = df['moving_avg'] - (NUM_STD * df['std_dev'])
+    return df
+
+
+def find_weird_candles(df):
+    # Candles between CHECK_START and CHECK_END whose high or low is outside the bands
+    in_window = df.index.indexer_between_time(CHECK_START, CHECK_END)
+    window = df.iloc[in_window]
+    exceeds = (window['high'] > window['upper_band']) | (window['low'] < window['lower_band'])
+    weird = window[exceeds.to_numpy()]
+    return weird.reset_index()[ANALYSIS_COLUMNS]
+
+
+def _output_paths(file_path, output_folder_filtered, output_folder_analysis):
+    filtered_output_path = os.path.join(output_folder_filtered, os.path.basename(file_path))
+    analysis_output_path = os.path.join(output_folder_analysis, f"{os.path.splitext(os.path.basename(file_path))[0]}_weird_candles_analysis.csv")
+    return filtered_output_path, analysis_output_path
+
 
 def process_file(file_path, output_folder_filtered, output_folder_analysis):
     # Load the data into a DataFrame
-    print(f"Loading data from {file_path}...")
-    columns = ['datetime', 'open', 'high', 'low', 'close', 'volume']
-    df = pd.read_csv(file_path, names=columns, parse_dates=['datetime'])
-    df.set_index('datetime', inplace=True)
-    print(f"Data loaded successfully. DataFrame shape: {df.shape}")
+    logger.info("Loading data from %s...", file_path)
+    with stage("load"):
+        df = load_prices(file_path)
+    count("rows", len(df))
+    logger.debug("Data loaded successfully. DataFrame shape: %s", df.shape)
 
     # Calculate Bollinger Bands with a 50-period moving average and 3 standard deviations
-    print("Calculating Bollinger Bands...")
-    df['moving_avg'] = df['close'].rolling(window=50, min_periods=1).mean()
-    df['std_dev'] = df['close'].rolling(window=50, min_periods=1).std()
-    df['upper_band'] = df['moving_avg'] + (3 * df['std_dev'])
-    df['lower_band'] = df['moving_avg'] - (3 * df['std_dev'])
-
-    # Filter data between 8:00 am and 9:00 am only
-    print("Filtering data between 8:00 am and 8:30 am...")
-    df_filtered = df.between_time('08:00', '08:30')
-    print(f"Filtered DataFrame shape: {df_filtered.shape}")
-
-    # Identify candles that exceed the upper or lower Bollinger Bands
-    print("Identifying candles that exceed the Bollinger Bands...")
-    results = []
-
-    for i in range(len(df_filtered)):
-        current = df_filtered.iloc[i]
-
-        # Check if the high or low exceeds the upper or lower Bollinger Bands
-        if current['high'] > current['upper_band'] or current['low'] < current['lower_band']:
-            results.append({
-                'datetime': current.name,
-                'open': current['open'],
-                'high': current['high'],
-                'low': current['low'],
-                'close': current['close'],
-                'moving_avg': current['moving_avg'],
-                'upper_band': current['upper_band'],
-                'lower_band': current['lower_band']
-            })
-            print(f"Candle exceeding Bollinger Bands found at {current.name}")
-
-    # Create a DataFrame for the results
-    print("Creating results DataFrame...")
-    results_df = pd.DataFrame(results)
-    print(f"Results DataFrame created. Number of identified candles: {len(results_df)}")
+    logger.debug("Calculating Bollinger Bands...")
+    with stage("bands"):
+        add_bollinger_bands(df)
+
+    # Identify candles between 8:00 am and 8:30 am that exceed the upper or lower Bollinger Bands
+    logger.debug("Identifying candles between 8:00 am and 8:30 am that exceed the Bollinger Bands...")
+    with stage("flag"):
+        results_df = find_weird_candles(df)
+    count("weird_candles", len(results_df))
+    logger.info("Number of identified candles: %d", len(results_df))
+
+    save_outputs(df, results_df, file_path, output_folder_filtered, output_folder_analysis)
+    return {'rows': len(df), 'weird_candles': len(results_df)}
+
+
+def save_outputs(df, results_df, file_path, output_folder_filtered, output_folder_analysis):
+    # Write the filtered dataset and the weird candle analysis, only if any weird
+    # candles were found.  Either folder may be None to skip that output.
+    filtered_output_path, analysis_output_path = _output_paths(file_path, output_folder_filtered or '', output_folder_analysis or '')
+    if results_df.empty:
+        logger.info("No weird candles identified.")
+        return
 
     # Save the filtered dataset (excluding identified weird candles)
-    print("Removing identified candles from the original dataset...")
-    if not results_df.empty:
-        df_filtered_cleaned = df.drop(index=results_df['datetime'])
-        filtered_output_path = os.path.join(output_folder_filtered, os.path.basename(file_path))
-        os.makedirs(output_folder_filtered, exist_ok=True)
-        df_filtered_cleaned.to_csv(filtered_output_path)
-        print(f"Filtered dataset saved to {filtered_output_path}")
+    if output_folder_filtered:
+        logger.debug("Removing identified candles from the original dataset...")
+        with stage("output_write"):
+            df_filtered_cleaned = df.drop(index=results_df['datetime'])
+            os.makedirs(output_folder_filtered, exist_ok=True)
+            df_filtered_cleaned.to_csv(filtered_output_path)
+        logger.info("Filtered dataset saved to %s", filtered_output_path)
 
     # Save the analysis of weird candles
-    if not results_df.empty:
-        analysis_output_path = os.path.join(output_folder_analysis, f"{os.path.splitext(os.path.basename(file_path))[0]}_weird_candles_analysis.csv")
-        os.makedirs(output_folder_analysis, exist_ok=True)
-        results_df.to_csv(analysis_output_path, index=False)
-        print(f"Weird candles analysis saved to {analysis_output_path}")
+    if output_folder_analysis:
+        with stage("output_write"):
+            os.makedirs(output_folder_analysis, exist_ok=True)
+            results_df.to_csv(analysis_output_path, index=False)
+        logger.info("Weird candles analysis saved to %s", analysis_output_path)
+
+
+def process_file_streaming(file_path, output_folder_filtered, output_folder_analysis, chunksize=500_000):
+    """Same outputs as process_file, reading and writing ``chunksize`` rows at a time.
+
+    Only the last WINDOW - 1 closes are carried from one chunk to the next, so
+    peak memory depends on the chunk size, not on the size of the file.  Both
+    outputs are written to ``.partial`` files and moved into place at the end,
+    and (like process_file) only if at least one weird candle was found.
+    Returns the row and weird-candle counts along with the closing rolling
+    window state (last timestamp and closes), so a later run can resume.
+    """
+    logger.info("Streaming data from %s in chunks of %d rows...", file_path, chunksize)
+    filtered_output_path, analysis_output_path = _output_paths(file_path, output_folder_filtered, output_folder_analysis)
+    os.makedirs(output_folder_filtered, exist_ok=True)
+    os.makedirs(output_folder_analysis, exist_ok=True)
+    filtered_partial = filtered_output_path + '.partial'
+    analysis_partial = analysis_output_path + '.partial'
+
+    history = np.array([])
+    last_timestamp = None
+    rows = 0
+    weird_count = 0
+    with open(filtered_partial, 'w', newline='') as filtered_out, open(analysis_partial, 'w', newline='') as analysis_out:
+        for i, chunk in enumerate(iter_prices(file_path, chunksize=chunksize)):
+            with stage("bands"):
+                add_bollinger_bands(chunk, history)
+                history = np.concatenate([history, chunk['close'].to_numpy()])[-(WINDOW - 1):]
+            last_timestamp = chunk.index[-1] if len(chunk) else last_timestamp
+
+            with stage("flag"):
+                weird = find_weird_candles(chunk)
+            rows += len(chunk)
+            weird_count += len(weird)
+            with stage("output_write"):
+                if not weird.empty:
+                    chunk = chunk.drop(index=weird['datetime'])
+                chunk.to_csv(filtered_out, header=(i == 0))
+                weird.to_csv(analysis_out, header=(i == 0), index=False)
+            logger.debug("Processed %d rows, %d weird candles so far", rows, weird_count)
+    count("rows", rows)
+    count("weird_candles", weird_count)
+
+    if weird_count:
+        os.replace(filtered_partial, filtered_output_path)
+        os.replace(analysis_partial, analysis_output_path)
+        logger.info("Filtered dataset saved to %s", filtered_output_path)
+        logger.info("Weird candles analysis saved to %s", analysis_output_path)
     else:
-        print("No weird candles identified.")
+        os.remove(filtered_partial)
+        os.remove(analysis_partial)
+        logger.info("No weird candles identified.")
+
+    return {'rows': rows, 'weird_candles': weird_count, 'last_timestamp': last_timestamp, 'history': history}
+
+
+def _content_hash(file_path, previous=None):
+    # BLAKE2b of the file contents.  If size and modification time match the
+    # previous run, the file has not been touched and its old hash is reused.
+    stat = os.stat(file_path)
+    if previous and previous.get('size') == stat.st_size and previous.get('mtime_ns') == stat.st_mtime_ns:
+        return previous['hash'], stat
+    digest = hashlib.blake2b()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest(), stat
+
+
+def _clean_one(file_path, output_folder_filtered, output_folder_analysis, chunk_rows, previous):
+    # Batch worker: skip the file if its contents and the band parameters are
+    # unchanged since the last batch run and its outputs are still there
+    started = time.perf_counter()
+    content_hash, stat = _content_hash(file_path, previous)
+    entry = {'hash': content_hash, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'params': BAND_PARAMS}
+
+    filtered_output_path, analysis_output_path = _output_paths(file_path, output_folder_filtered, output_folder_analysis)
+    outputs_present = os.path.exists(filtered_output_path) and os.path.exists(analysis_output_path)
+    if (previous and previous.get('hash') == content_hash and previous.get('params') == BAND_PARAMS
+            and (outputs_present or not previous.get('weird_candles'))):
+        return dict(previous, **entry, status='skipped', seconds=time.perf_counter() - started)
+
+    with instrumentation.run(ticker_from_path(file_path)) as report:
+        if chunk_rows:
+            summary = process_file_streaming(file_path, output_folder_filtered, output_folder_analysis, chunk_rows)
+        else:
+            summary = process_file(file_path, output_folder_filtered, output_folder_analysis)
+    entry.update(rows=summary['rows'], weird_candles=summary['weird_candles'])
+    return dict(entry, status='processed', seconds=time.perf_counter() - started, report=report.as_dict())
+
+
+def process_folder(input_folder, output_folder_filtered, output_folder_analysis, workers=1, chunk_rows=0):
+    """Clean every .txt file in ``input_folder`` with ``workers`` processes.
+
+    Files whose content hash and band parameters match the previous batch run
+    (recorded in ``batch_manifest.json`` in the analysis folder) are skipped.
+    Writes ``weird_candles_summary.csv`` with one row per file (rows, weird
+    candles, status, wall time, rows/sec) and returns it as a DataFrame.
+    """
+    manifest_path = os.path.join(output_folder_analysis, 'batch_manifest.json')
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+
+    file_names = sorted(name for name in os.listdir(input_folder) if name.endswith(".txt"))
+    reports = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(_clean_one, os.path.join(input_folder, name), output_folder_filtered,
+                        output_folder_analysis, chunk_rows, manifest.get(name)): name
+            for name in file_names
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                report = future.result()
+            except Exception as e:
+                logger.warning("Failed to clean %s: %r", name, e)
+                manifest.pop(name, None)
+                reports[name] = {'status': 'failed', 'error': repr(e)}
+                continue
+            manifest[name] = {k: v for k, v in report.items() if k not in ('status', 'seconds', 'report')}
+            reports[name] = report
+
+    os.makedirs(output_folder_analysis, exist_ok=True)
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    summary = pd.DataFrame([
+        {
+            'ticker': ticker_from_path(name),
+            'file': name,
+            'status': reports[name]['status'],
+            'rows': reports[name].get('rows'),
+            'weird_candles': reports[name].get('weird_candles'),
+            'seconds': reports[name].get('seconds'),
+        }
+        for name in file_names
+    ], columns=['ticker', 'file', 'status', 'rows', 'weird_candles', 'seconds'])
+    summary[['rows', 'weird_candles']] = summary[['rows', 'weird_candles']].astype('Int64')
+    summary['weird_per_million_rows'] = summary['weird_candles'] / summary['rows'] * 1e6
+    processed = summary['status'] == 'processed'
+    summary['rows_per_sec'] = (summary['rows'] / summary['seconds']).where(processed)
+    summary_path = os.path.join(output_folder_analysis, 'weird_candles_summary.csv')
+    summary.to_csv(summary_path, index=False)
+
+    logger.info("Weird candle summary:\n%s",
+                summary[['ticker', 'status', 'rows', 'weird_candles', 'seconds', 'rows_per_sec']].to_string(index=False))
+    logger.info("Weird candle summary across %d files saved to %s", len(summary), summary_path)
+    log_reports([reports[name]['report'] for name in file_names if 'report' in reports[name]])
+    return summary
+
 
 # Input and output folder paths (use environment variables or relative paths)
 input_folder = os.getenv('INPUT_FOLDER', 'input_data')
 output_folder_filtered = os.getenv('OUTPUT_FOLDER_FILTERED', 'output/filtered_data')
 output_folder_analysis = os.getenv('OUTPUT_FOLDER_ANALYSIS', 'output/weird_candles_analysis')
 
-# Process all files in the input folder
-print("Processing all files in the input folder...")
-os.makedirs(input_folder, exist_ok=True)
+# Set STREAM_CHUNK_ROWS (e.g. 500000) to process files in chunks with constant memory
+stream_chunk_rows = int(os.getenv('STREAM_CHUNK_ROWS', '0'))
+
+# Set CLEAN_WORKERS (e.g. 8) to clean files in parallel and skip unchanged ones
+clean_workers = int(os.getenv('CLEAN_WORKERS', '0'))
 
-for file_name in os.listdir(input_folder):
-    if file_name.endswith(".txt"):
-        file_path = os.path.join(input_folder, file_name)
-        process_file(file_path, output_folder_filtered, output_folder_analysis)
+if __name__ == "__main__":
+    configure_logging()
+    # Process all files in the input folder
+    logger.info("Processing all files in the input folder...")
+    os.makedirs(input_folder, exist_ok=True)
+
+    if clean_workers:
+        process_folder(input_folder, output_folder_filtered, output_folder_analysis, clean_workers, stream_chunk_rows)
+    else:
+        reports = []
+        for file_name in os.listdir(input_folder):
+            if file_name.endswith(".txt"):
+                file_path = os.path.join(input_folder, file_name)
+                with instrumentation.run(ticker_from_path(file_name)) as report:
+                    if stream_chunk_rows:
+                        process_file_streaming(file_path, output_folder_filtered, output_folder_analysis, stream_chunk_rows)
+                    else:
+                        process_file(file_path, output_folder_filtered, output_folder_analysis)
+                reports.append(report)
+        log_reports(reports)
 
-print("All files processed.")
+    logger.info("All files processed.")
@@ -1,5 +1,14 @@
+import logging
+
+import numpy as np
 import pandas as pd
 
+import instrumentation
+from daily_rollup import SIGNAL_TIME, build_rollup, gap_up_days, load_rollup
+from instrumentation import configure_logging, count, log_reports, stage
+from price_cache import load_prices, ticker_from_path
+from trade_sink import TradeSink
+
 # User Instructions:
 # 1. Set the `input_file` variable to the path of your dataset file.
 # 2. Set the `output_file` variable to the desired path for the output file.
@@ -7,159 +16,244 @@ import pandas as pd
 
 # Path to the dataset file
 input_file = "path/to/your/AAPL_1min_data.csv"  # Replace with your file path
-output_file = "path/to/output/backtest_trade_details.csv"  # Replace with your desired output path
-
-# Load the data, add column names, and parse dates
-print("Loading data...")
-data = pd.read_csv(
-    input_file,
-    header=None,
-    names=["datetime", "open", "high", "low", "close", "volume"],
-    parse_dates=["datetime"]
-)
-print("Data loaded successfully with shape:", data.shape)
-
-# Ensure the data is sorted by datetime for correct temporal order
-data.sort_values(by="datetime", inplace=True)
-print("Data sorted by datetime.")
+output_file = "path/to/output/backtest_trade_details.csv"  # Replace with your desired output path (.parquet/.arrow need pyarrow)
+summary_output_file = None  # e.g. "path/to/output/backtest_summary.csv" for per-combination statistics
 
 # Filter the data to include only records from January 1, 2020, onward (or modify as needed)
 start_date = "2020-01-01"  # Modify to your preferred start date
-data = data[data["datetime"] >= start_date]
-print(f"Data filtered to start from {start_date}. New shape: {data.shape}")
-
-# Set datetime as the index for easier time-based operations
-print("Setting datetime as index...")
-data.set_index("datetime", inplace=True)
 
-# Resample data to daily frequency for signal detection; include only market hours
+# Market hours used for the next-day exit window
 market_open = "09:30"
 market_close = "16:00"
-print("Resampling data to daily frequency for open and close prices (9:30 to 16:00)...")
-daily_data = data.between_time(market_open, market_close).resample("D").agg({"open": "first", "close": "last"})
-print("Daily data created with shape:", daily_data.shape)
+
+# Gap-ups are measured against the previous trading session's close ("session").
+# "calendar_day" reproduces the original behaviour, which only compared against
+# the day before and so never found signals on Mondays or after holidays.
+prior_close_rule = "session"
+
+# Only these columns are read from the dataset
+price_columns = ["open", "low", "close"]
 
 # Define parameters for backtesting
 drawdown_levels = [x * 0.25 for x in range(1, 5)]  # Test drawdowns [0.25%, 0.5%, ..., 1.0%]
 stop_loss_levels = [x * 0.5 for x in range(1, 5)]  # Test stop-losses [0.5%, 1.0%, ..., 2.0%]
-trades = []  # List to store detailed trade information for each test
-
-# Begin backtest loop
-print("Starting backtest over drawdown levels:", drawdown_levels)
-for drawdown in drawdown_levels:
-    print(f"Processing drawdown level: {drawdown}%")
-    
-    # Loop through each stop-loss level for the current drawdown level
-    for stop_loss in stop_loss_levels:
-        print(f"Testing stop-loss level: {stop_loss}% with drawdown level: {drawdown}%")
-        
-        # Iterate over each day to identify valid trading signals
-        for date in daily_data.index:
-            print(f"\nChecking date: {date}")
-            try:
-                # Signal 1: Check if today's open is >= prior day's close * 1.005
-                prior_close = daily_data.loc[date - pd.Timedelta(days=1), "close"]
-                print("Prior day close:", prior_close)
-                
-                if daily_data.loc[date, "open"] >= prior_close * 1.005:
-                    print("Valid trading day signal found for date:", date)
-                    
-                    # Define 11:15 AM timestamp on the signal day for signal price check
-                    signal_time = pd.Timestamp(date.year, date.month, date.day, 11, 15)
-                    if signal_time not in data.index:
-                        print(f"No data available at signal time {signal_time}, skipping this date.")
-                        continue
-
-                    signal_price = data.loc[signal_time, "close"]
-                    print("Signal price at 11:15:", signal_price)
-                    
-                    # Signal 2: Check if 11:15 close price > open price of the day
-                    if signal_price > daily_data.loc[date, "open"]:
-                        print("Valid signal confirmed at 11:15 on:", date)
-                        
-                        # Monitor drawdown within the signal day (11:15 to 4:00 PM)
-                        drawdown_entry_price = signal_price * (1 - drawdown / 100)
-                        print(f"Checking for entry at drawdown entry price: {drawdown_entry_price}")
-                        
-                        # Define intraday window for drawdown check (11:15 AM to 4:00 PM)
-                        intraday_data = data.between_time("11:15", "16:00").loc[date:date + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)]
-                        if intraday_data.empty:
-                            print(f"No intraday data available for {date} from 11:15 to 16:00, skipping this date.")
-                            continue
-
-                        entry = intraday_data[intraday_data["close"] <= drawdown_entry_price]
-                        
-                        if not entry.empty:
-                            entry_price = entry.iloc[0]["close"]
-                            entry_time = entry.index[0]
-                            print("Entry found at", entry_time, "with price:", entry_price)
-                            
-                            # Calculate stop-loss based on entry price
-                            stop_loss_price = entry_price * (1 - stop_loss / 100)
-                            print(f"Stop-loss price set at: {stop_loss_price}")
-                            
-                            # Define next day's market hours (9:30 AM to 4:00 PM)
-                            next_day_open = entry_time + pd.Timedelta(days=1)
-                            next_day_open = next_day_open.replace(hour=9, minute=30)
-                            next_day_close = next_day_open.replace(hour=16, minute=0)
-                            
-                            # Record the lowest price during the holding period
-                            holding_period_data = data.loc[entry_time:next_day_close]
-                            min_price = holding_period_data["low"].min()
-                            print("Lowest price during holding period:", min_price)
-                            
-                            # Check for exit conditions (profit target, stop-loss, or final close)
-                            next_day_data = data.loc[next_day_open:next_day_close]
-                            if next_day_data.empty:
-                                print(f"No next-day data available for {next_day_open.date()} from 09:30 to 16:00, skipping this trade.")
-                                continue
-
-                            profit_exit = next_day_data[next_day_data["close"] >= signal_price]
-                            stop_loss_exit = next_day_data[next_day_data["close"] <= stop_loss_price]
-                            
-                            # Exit based on stop-loss or profit target
-                            if not stop_loss_exit.empty:
-                                exit_price = stop_loss_exit.iloc[0]["close"]
-                                exit_time = stop_loss_exit.index[0]
-                                trade_return = (exit_price - entry_price) / entry_price * 100
-                                exit_reason = "Stop-loss"
-                                print(f"Stop-loss exit at {exit_time} with exit price: {exit_price}")
-                            elif not profit_exit.empty:
-                                exit_price = profit_exit.iloc[0]["close"]
-                                exit_time = profit_exit.index[0]
-                                trade_return = (exit_price - entry_price) / entry_price * 100
-                                exit_reason = "Profit Target"
-                                print(f"Profit exit achieved at {exit_time} with exit price: {exit_price}")
-                            else:
-                                final_exit_price = next_day_data.iloc[-1]["close"]
-                                final_exit_time = next_day_data.index[-1]
-                                trade_return = (final_exit_price - entry_price) / entry_price * 100
-                                exit_price = final_exit_price
-                                exit_time = final_exit_time
-                                exit_reason = "Final Exit"
-                                print(f"No profit or stop-loss exit, final exit at {final_exit_time} with price: {final_exit_price}")
-                            
-                            # Store detailed trade information
-                            trades.append({
-                                "signal_price": signal_price,
-                                "entry_price": entry_price,
-                                "entry_datetime": entry_time,
-                                "lowest_price": min_price,
-                                "exit_price": exit_price,
-                                "exit_datetime": exit_time,
-                                "trade_return (%)": trade_return,
-                                "drawdown_level (%)": drawdown,
-                                "stop_loss_level (%)": stop_loss,
-                                "exit_reason": exit_reason
-                            })
-                            print("Trade recorded:", trades[-1])
-            
-            except KeyError as e:
-                # Handle any missing data issues gracefully
-                print("KeyError encountered:", e)
-                continue
-
-# Save trades to a CSV file for analysis
-trades_df = pd.DataFrame(trades)
-trades_df.to_csv(output_file, index=False)
-print(f"Trade details saved to '{output_file}'.")
+
+TRADE_COLUMNS = [
+    "signal_price",
+    "entry_price",
+    "entry_datetime",
+    "lowest_price",
+    "exit_price",
+    "exit_datetime",
+    "trade_return (%)",
+    "drawdown_level (%)",
+    "stop_loss_level (%)",
+    "exit_reason",
+]
+
+NS_PER_DAY = pd.Timedelta(days=1).value
+
+logger = logging.getLogger(__name__)
+
+
+def _time_of_day_ns(hhmm):
+    # "11:15" -> nanoseconds after midnight
+    return pd.Timedelta(f"{hhmm}:00").value
+
+
+def _index_ns(data):
+    # Datetime index as int64 nanoseconds, whatever resolution pandas parsed it with
+    return data.index.values.astype("datetime64[ns]").view(np.int64)
+
+
+def _window_matrix(values, start, end, fill):
+    # Stack the variable-length slices values[start:end] into one padded 2D array
+    lengths = end - start
+    width = int(lengths.max()) if len(lengths) else 0
+    offsets = np.arange(width)
+    idx = np.minimum(start[:, None] + offsets, len(values) - 1)
+    return np.where(offsets < lengths[:, None], values[idx], fill)
+
+
+def load_data(path, start_date=None, columns=None):
+    # Load the data from `start_date` onward, sorted by datetime and indexed by it.
+    # Reads the columnar cache when price_cache.py has converted the file, otherwise the CSV.
+    logger.info("Loading %s...", path)
+    with stage("load"):
+        data = load_prices(path, start=start_date, columns=columns)
+    count("rows", len(data))
+    logger.info("Data loaded successfully with shape: %s", data.shape)
+    return data
+
+
+def find_signals(data, rollup=None):
+    """Return one row per signal day with the row ranges the trade logic needs.
+
+    Signal days are read from the daily rollup (built from ``data`` when not
+    given): days that open at least 0.5% above the previous close and close
+    their 11:15 bar above that open.  ``entry_start:entry_end`` indexes the
+    11:15-16:00 bars of the signal day in ``data`` and ``exit_start:exit_end``
+    the 09:30-16:00 bars of the following calendar day.
+    """
+    if rollup is None:
+        with stage("rollup"):
+            rollup = build_rollup(data)
+    with stage("signal_scan"):
+        signals = _scan_signals(data, rollup)
+    if len(data):
+        # Sessions in range, and those without an 11:15 bar to check (the old loop's KeyError skips)
+        scanned = rollup.loc[data.index[0].normalize():data.index[-1]]
+        count("days_scanned", len(scanned))
+        count("skipped_no_signal_bar", int((scanned["close_1115"].isna() & (scanned["bars"] > 0)).sum()))
+    count("signals", len(signals))
+    return signals
+
+
+def _scan_signals(data, rollup):
+    days = gap_up_days(rollup, previous=prior_close_rule)
+
+    ts = _index_ns(data)
+    closes = data["close"].to_numpy()
+    session_open = _time_of_day_ns(market_open)
+    session_close = _time_of_day_ns(market_close)
+
+    # Locate each signal day's 11:15 bar; a saved rollup may cover days outside `data`
+    days = days.index.values.astype("datetime64[ns]").view(np.int64)
+    signal_ts = days + _time_of_day_ns(SIGNAL_TIME)
+    signal_row = np.searchsorted(ts, signal_ts)
+    in_data = signal_row < len(ts)
+    in_data[in_data] = ts[signal_row[in_data]] == signal_ts[in_data]
+    days, signal_row = days[in_data], signal_row[in_data]
+
+    next_day = days + NS_PER_DAY
+    return pd.DataFrame({
+        "date": pd.to_datetime(days),
+        "signal_price": closes[signal_row],
+        "entry_start": signal_row,
+        "entry_end": np.searchsorted(ts, days + session_close, side="right"),
+        "exit_start": np.searchsorted(ts, next_day + session_open),
+        "exit_end": np.searchsorted(ts, next_day + session_close, side="right"),
+    })
+
+
+def run_backtest(data, drawdown_levels, stop_loss_levels, signals=None, sink=None, ticker=None):
+    """Simulate every (drawdown, stop_loss) combination over all signal days.
+
+    Trades come back in the same order and with the same columns as the
+    original per-day loop: by drawdown, then stop-loss, then date.  With a
+    ``sink`` (a trade_sink.TradeSink) each combination's trades are written
+    to it as soon as they are computed and nothing is returned; ``ticker``
+    then tags them with a leading ``ticker`` column for the sink's summary.
+    """
+    if signals is None:
+        signals = find_signals(data)
+
+    # Trades need next-day data to exit, so days without it can never trade
+    has_next_day = signals["exit_start"] < signals["exit_end"]
+    count("skipped_no_next_day", int((~has_next_day).sum()))
+    signals = signals[has_next_day]
+    if signals.empty:
+        return None if sink is not None else pd.DataFrame(columns=TRADE_COLUMNS)
+
+    ts = _index_ns(data)
+    closes = data["close"].to_numpy()
+    lows = np.append(data["low"].to_numpy(), np.inf)  # sentinel so reduceat can end at len(data)
+    signal_price = signals["signal_price"].to_numpy()
+    entry_start = signals["entry_start"].to_numpy()
+    exit_start = signals["exit_start"].to_numpy()
+    exit_end = signals["exit_end"].to_numpy()
+
+    # Intraday (11:15-16:00) and next-day (09:30-16:00) closes, one row per signal
+    with stage("entry_search"):
+        entry_window = _window_matrix(closes, entry_start, signals["entry_end"].to_numpy(), np.inf)
+    with stage("exit_search"):
+        exit_window = _window_matrix(closes, exit_start, exit_end, np.nan)
+
+        # The profit target is the signal price, so it does not depend on the grid
+        profit_hits = exit_window >= signal_price[:, None]
+        has_profit = profit_hits.any(axis=1)
+        profit_row = exit_start + profit_hits.argmax(axis=1)
+
+    trades = []
+    for drawdown in drawdown_levels:
+        logger.debug("Processing drawdown level: %s%%", drawdown)
+        with stage("entry_search"):
+            drawdown_entry_price = signal_price * (1 - drawdown / 100)
+            entry_hits = entry_window <= drawdown_entry_price[:, None]
+            entered = entry_hits.any(axis=1)
+            entry_row = (entry_start + entry_hits.argmax(axis=1))[entered]
+            entry_price = closes[entry_row]
+        count("entries", len(entry_row))
+
+        with stage("exit_search"):
+            # Lowest low from entry through the next day's close
+            bounds = np.column_stack([entry_row, exit_end[entered]]).ravel()
+            lowest_price = np.minimum.reduceat(lows, bounds)[::2]
+
+        for stop_loss in stop_loss_levels:
+            with stage("exit_search"):
+                stop_loss_price = entry_price * (1 - stop_loss / 100)
+                stop_hits = exit_window[entered] <= stop_loss_price[:, None]
+
+                # Stop-loss takes precedence whenever it triggers, then profit target, then final close
+                has_stop = stop_hits.any(axis=1)
+                exit_row = np.where(
+                    has_stop,
+                    exit_start[entered] + stop_hits.argmax(axis=1),
+                    np.where(has_profit[entered], profit_row[entered], exit_end[entered] - 1),
+                )
+                exit_reason = np.where(
+                    has_stop, "Stop-loss", np.where(has_profit[entered], "Profit Target", "Final Exit")
+                )
+                exit_price = closes[exit_row]
+
+            batch = pd.DataFrame({
+                "signal_price": signal_price[entered],
+                "entry_price": entry_price,
+                "entry_datetime": pd.to_datetime(ts[entry_row]),
+                "lowest_price": lowest_price,
+                "exit_price": exit_price,
+                "exit_datetime": pd.to_datetime(ts[exit_row]),
+                "trade_return (%)": (exit_price - entry_price) / entry_price * 100,
+                "drawdown_level (%)": drawdown,
+                "stop_loss_level (%)": stop_loss,
+                "exit_reason": exit_reason,
+            })
+            count("trades", len(batch))
+            if sink is None:
+                trades.append(batch)
+            else:
+                with stage("output_write"):
+                    sink.write(batch, ticker=ticker)
+
+    if sink is not None:
+        return None
+    if not trades:
+        return pd.DataFrame(columns=TRADE_COLUMNS)
+    return pd.concat(trades, ignore_index=True)
+
+
+if __name__ == "__main__":
+    configure_logging()
+    ticker = ticker_from_path(input_file)
+    with instrumentation.run(ticker) as report:
+        data = load_data(input_file, start_date, price_columns)
+
+        logger.info("Finding signal days (gap-up open and 11:15 close above the open)...")
+        with stage("rollup"):
+            rollup = load_rollup(input_file)
+        signals = find_signals(data, rollup)
+        logger.info("Found %d signal days.", len(signals))
+
+        # Begin backtest over every drawdown / stop-loss combination
+        logger.info("Starting backtest over drawdown levels: %s", drawdown_levels)
+        # Trades are written to the output file as each combination finishes
+        with TradeSink(output_file, columns=["ticker"] + TRADE_COLUMNS) as sink:
+            run_backtest(data, drawdown_levels, stop_loss_levels, signals, sink=sink, ticker=ticker)
+        logger.info("%d trade details saved to '%s'.", sink.rows, sink.path)
+
+        if summary_output_file:
+            with stage("output_write"):
+                sink.summary().to_csv(summary_output_file, index=False)
+            logger.info("Per-combination summary saved to '%s'.", summary_output_file)
+    log_reports([report])
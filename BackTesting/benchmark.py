@@ -0,0 +1,170 @@
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import time
+
+import numpy as np
+import pandas as pd
+
+import backtest
+import sweep
+from daily_rollup import build_rollup
+from instrumentation import configure_logging
+from Identify_and_Remove_Clearing_Candles import add_bollinger_bands, find_weird_candles
+from price_cache import convert_file, load_prices
+from synthetic_data import generate_bars, write_price_file
+
+# Reproducible timings of the backtest and cleaner stages on synthetic data.
+#
+#     python benchmark.py                                  # 1y, 5y and 12y, results in benchmark_results.json
+#     python benchmark.py --sizes 1y --repeat 5 --output after.json --compare before.json
+#
+# Synthetic_data.py writes one seeded file per size into --data-dir (kept and
+# reused by later runs), so every commit is timed on identical input.  Each
+# stage runs --repeat times and the min and median wall times are recorded,
+# along with the commit, library versions and machine, in a JSON file that
+# --compare can diff against an earlier run.
+
+END_DATE = "2024-12-31"
+SIZES = {"1y": 1, "5y": 5, "12y": 12}
+
+logger = logging.getLogger(__name__)
+
+
+def _git_commit():
+    try:
+        here = os.path.dirname(os.path.abspath(__file__))
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=here, capture_output=True, text=True, check=True)
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=here,
+                                capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit.stdout.strip(), bool(status.stdout.strip())
+
+
+def dataset_path(data_dir, size, seed):
+    return os.path.join(data_dir, f"BENCH{size.upper()}S{seed}_2012_onward_1min_UNADJUSTED.txt")
+
+
+def ensure_dataset(data_dir, size, seed):
+    path = dataset_path(data_dir, size, seed)
+    if not os.path.exists(path):
+        start = (pd.Timestamp(END_DATE) - pd.DateOffset(years=SIZES[size]) + pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+        logger.info("Generating %s of synthetic bars (%s to %s) in %s...", size, start, END_DATE, path)
+        os.makedirs(data_dir, exist_ok=True)
+        write_price_file(generate_bars(start, END_DATE, seed=seed), path + ".tmp")
+        os.replace(path + ".tmp", path)
+    return path
+
+
+def time_stage(function, repeat):
+    # Run `function` `repeat` times with its INFO and DEBUG logging off; return (min, median, last result)
+    seconds = []
+    logging.disable(logging.INFO)
+    try:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = function()
+            seconds.append(time.perf_counter() - started)
+    finally:
+        logging.disable(logging.NOTSET)
+    return min(seconds), statistics.median(seconds), result
+
+
+def benchmark_file(path, size, repeat, cache_root):
+    """Time every stage on one file and return one result dict per stage."""
+    results = []
+
+    def record(stage, function, **extra):
+        best, median, result = time_stage(function, repeat)
+        results.append(dict(size=size, stage=stage, seconds_min=best, seconds_median=median, repeat=repeat, **extra))
+        logger.info("  %4s %-16s min %8.3fs  median %8.3fs", size, stage, best, median)
+        return result
+
+    data = record("load_csv", lambda: load_prices(path, root=os.path.join(cache_root, "none")))
+    rows = len(data)
+    results[-1]["rows"] = rows
+    record("convert_cache", lambda: convert_file(path, root=cache_root))
+    data = record("load_cache", lambda: load_prices(path, root=cache_root), rows=rows)
+
+    record("daily_resample", lambda: data.between_time(backtest.market_open, backtest.market_close)
+           .resample("D").agg({"open": "first", "close": "last"}), rows=rows)
+    rollup = record("rollup", lambda: build_rollup(data), rows=rows)
+    signals = record("signals", lambda: backtest.find_signals(data, rollup), rows=rows)
+    trades = record("backtest_grid", lambda: backtest.run_backtest(
+        data, backtest.drawdown_levels, backtest.stop_loss_levels, signals), rows=rows,
+        signals=len(signals), grid=len(backtest.drawdown_levels) * len(backtest.stop_loss_levels))
+    results[-1]["trades"] = len(trades)
+    record("sweep_grid", lambda: sweep.sweep(data, sweep.drawdown_levels, sweep.stop_loss_levels, signals,
+                                             with_trades=False), rows=rows, signals=len(signals),
+           grid=len(sweep.drawdown_levels) * len(sweep.stop_loss_levels))
+
+    def clean():
+        frame = add_bollinger_bands(data.copy())
+        return find_weird_candles(frame)
+    weird = record("bollinger_clean", clean, rows=rows)
+    results[-1]["weird_candles"] = len(weird)
+    return results
+
+
+def compare(current, previous_path):
+    # Median time of each (size, stage) relative to an earlier results file
+    with open(previous_path) as f:
+        previous = json.load(f)
+    before = {(r["size"], r["stage"]): r["seconds_median"] for r in previous["results"]}
+    table = pd.DataFrame([
+        {
+            "size": r["size"],
+            "stage": r["stage"],
+            "before (s)": before.get((r["size"], r["stage"]), np.nan),
+            "after (s)": r["seconds_median"],
+        }
+        for r in current["results"]
+    ])
+    table["ratio"] = table["after (s)"] / table["before (s)"]
+    print(f"Compared with {previous_path} (commit {previous.get('git_commit')}):")
+    print(table.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the backtest and cleaner stages on seeded synthetic data.")
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=list(SIZES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage (default: %(default)s)")
+    parser.add_argument("--data-dir", default="../Benchmark_Data",
+                        help="Where the generated files and their cache are kept (default: %(default)s)")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", default=None, help="Earlier results file to compare against")
+    args = parser.parse_args()
+    configure_logging()
+
+    commit, dirty = _git_commit()
+    report = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "git_commit": commit,
+        "git_dirty": dirty,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "seed": args.seed,
+        "end_date": END_DATE,
+        "results": [],
+    }
+    for size in args.sizes:
+        path = ensure_dataset(args.data_dir, size, args.seed)
+        logger.info("Benchmarking %s...", os.path.basename(path))
+        report["results"].extend(benchmark_file(path, size, args.repeat, os.path.join(args.data_dir, "cache")))
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    logger.info("Results saved to '%s'.", args.output)
+    if args.compare:
+        compare(report, args.compare)
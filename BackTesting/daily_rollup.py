@@ -0,0 +1,179 @@
+import argparse
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.holiday import (
+    AbstractHolidayCalendar,
+    GoodFriday,
+    Holiday,
+    USLaborDay,
+    USMartinLutherKingJr,
+    USMemorialDay,
+    USPresidentsDay,
+    USThanksgivingDay,
+    nearest_workday,
+    sunday_to_monday,
+)
+from pandas.tseries.offsets import CustomBusinessDay
+
+from instrumentation import configure_logging
+from minute_matrix import build_minute_matrix
+from price_cache import (
+    cache_dir_for,
+    list_input_files,
+    load_prices,
+    price_data_folder,
+    source_signature,
+    ticker_from_path,
+)
+
+# Per-ticker daily session rollup.
+#
+# One row per NYSE trading day with the 09:30-16:00 session open, high, low and
+# close, the 11:15 close, and the close of the previous trading session (so a
+# Monday looks back to Friday and the day after a holiday to the day before
+# it).  Built once from the minute data and saved as a small CSV next to the
+# columnar cache; signal detection and the cross-sectional gap-up scan read only
+# this table.
+#
+#     python daily_rollup.py                       # latest day, every file in ../Price_Data
+#     python daily_rollup.py --date 2024-03-15 AAPL MSFT
+
+SIGNAL_TIME = "11:15"
+ROLLUP_COLUMNS = ["open", "high", "low", "close", "close_1115", "bars", "prev_date", "prev_close"]
+
+
+class NYSEHolidayCalendar(AbstractHolidayCalendar):
+    # Full-day NYSE closures.  Early closes are still trading days.
+    rules = [
+        Holiday("New Year's Day", month=1, day=1, observance=sunday_to_monday),
+        USMartinLutherKingJr,
+        USPresidentsDay,
+        GoodFriday,
+        USMemorialDay,
+        Holiday("Juneteenth", month=6, day=19, start_date="2022-01-01", observance=nearest_workday),
+        Holiday("Independence Day", month=7, day=4, observance=nearest_workday),
+        USLaborDay,
+        USThanksgivingDay,
+        Holiday("Christmas Day", month=12, day=25, observance=nearest_workday),
+        # Unscheduled closures since the Price_Data history begins in 2012
+        Holiday("Hurricane Sandy", year=2012, month=10, day=29),
+        Holiday("Hurricane Sandy", year=2012, month=10, day=30),
+        Holiday("George H.W. Bush Day of Mourning", year=2018, month=12, day=5),
+        Holiday("Jimmy Carter Day of Mourning", year=2025, month=1, day=9),
+    ]
+
+
+NYSE_SESSION = CustomBusinessDay(calendar=NYSEHolidayCalendar())
+
+logger = logging.getLogger(__name__)
+
+
+def trading_days(start, end):
+    """NYSE trading days from ``start`` to ``end`` inclusive."""
+    return pd.date_range(pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize(), freq=NYSE_SESSION)
+
+
+def build_rollup(data):
+    """Roll a datetime-indexed minute frame up to one row per trading session.
+
+    Rows cover every NYSE trading day between the first and last day in
+    ``data`` (plus any day that has session bars although the calendar says
+    closed).  A session without bars has NaN prices, which also makes the next
+    day's ``prev_close`` NaN rather than silently reaching further back.
+    """
+    if data.empty:
+        return pd.DataFrame(columns=ROLLUP_COLUMNS, index=pd.DatetimeIndex([], name="date"))
+    observed = data.index.normalize().unique()
+    days = trading_days(data.index[0], data.index[-1])
+    fields = [field for field in ("open", "high", "low", "close") if field in data]
+    matrix = build_minute_matrix(data, fields=fields, dtype=np.float64, calendar=days.union(observed))
+    rollup = matrix.daily_summary()
+    # Calendar days that only have pre-/post-market bars are not sessions
+    rollup = rollup[rollup.index.isin(days) | (rollup["bars"] > 0)].copy()
+    rollup["close_1115"] = matrix.at("close", SIGNAL_TIME)[matrix.days.isin(rollup.index)]
+    rollup["prev_date"] = pd.Series(rollup.index, index=rollup.index).shift(1)
+    rollup["prev_close"] = rollup["close"].shift(1)
+    return rollup.reindex(columns=ROLLUP_COLUMNS)
+
+
+def rollup_path(path):
+    return os.path.join(cache_dir_for(path), "daily_rollup.csv")
+
+
+def load_rollup(path):
+    """Read the saved rollup for a Price_Data file, (re)building it if the file changed."""
+    rollup_file = rollup_path(path)
+    meta_file = rollup_file + ".json"
+    try:
+        with open(meta_file) as f:
+            fresh = json.load(f) == source_signature(path)
+    except (OSError, ValueError):
+        fresh = False
+    if fresh:
+        return pd.read_csv(rollup_file, index_col="date", parse_dates=["date", "prev_date"])
+
+    logger.info("Building daily rollup for %s...", path)
+    rollup = build_rollup(load_prices(path, columns=["open", "high", "low", "close"]))
+    os.makedirs(os.path.dirname(rollup_file), exist_ok=True)
+    rollup.to_csv(rollup_file)
+    with open(meta_file, "w") as f:
+        json.dump(source_signature(path), f)
+    return rollup
+
+
+def gap_up_days(rollup, threshold=1.005, previous="session"):
+    """Days that opened at least ``threshold`` times the previous close and held above the open at 11:15.
+
+    ``previous="calendar_day"`` only accepts a previous session on the day
+    before, which skips Mondays and days after holidays like the original
+    backtest loop did.
+    """
+    prev_close = rollup["prev_close"]
+    if previous == "calendar_day":
+        prev_close = prev_close.where(rollup["prev_date"] == rollup.index - pd.Timedelta(days=1))
+    gapped = rollup["open"] >= prev_close * threshold
+    confirmed = rollup["close_1115"] > rollup["open"]
+    return rollup[gapped & confirmed]
+
+
+def scan_universe(paths, date=None, threshold=1.005):
+    """Which tickers gapped up on ``date`` (default: the latest day in the data), from the rollups alone."""
+    rows = []
+    for path in paths:
+        try:
+            rollup = load_rollup(path)
+        except Exception as e:
+            logger.warning("[%s] skipped: %r", ticker_from_path(path), e)
+            continue
+        day = rollup.index[-1] if date is None else pd.Timestamp(date)
+        if day not in rollup.index:
+            continue
+        today = rollup.loc[day]
+        rows.append({
+            "ticker": ticker_from_path(path),
+            "date": day,
+            "prev_close": today["prev_close"],
+            "open": today["open"],
+            "gap (%)": (today["open"] / today["prev_close"] - 1) * 100,
+            "close_1115": today["close_1115"],
+            "gapped_up": today["open"] >= today["prev_close"] * threshold,
+            "signal": day in gap_up_days(rollup.loc[[day]], threshold).index,
+        })
+    scan = pd.DataFrame(rows, columns=["ticker", "date", "prev_close", "open", "gap (%)", "close_1115", "gapped_up", "signal"])
+    return scan.sort_values(by="gap (%)", ascending=False, ignore_index=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build daily rollups and list the tickers that gapped up.")
+    parser.add_argument("sources", nargs="*", default=[price_data_folder],
+                        help="Price_Data directories, files or ticker symbols (default: %(default)s)")
+    parser.add_argument("--date", default=None, help="Day to scan (default: each ticker's latest day)")
+    args = parser.parse_args()
+    configure_logging()
+
+    scan = scan_universe(list_input_files(args.sources), args.date)
+    print(scan[scan["gapped_up"]].to_string(index=False))
@@ -0,0 +1,292 @@
+import argparse
+import hashlib
+import io
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+import backtest
+from daily_rollup import build_rollup
+from Identify_and_Remove_Clearing_Candles import (
+    BAND_PARAMS,
+    WINDOW,
+    _output_paths,
+    add_bollinger_bands,
+    find_weird_candles,
+    input_folder,
+    output_folder_analysis,
+    output_folder_filtered,
+    process_file_streaming,
+)
+from instrumentation import configure_logging
+from price_cache import COLUMNS, read_price_csv
+
+# Incremental cleaning and backtesting of newly appended bars.
+#
+# New 1-minute bars are appended to the Price_Data files every day.  Instead of
+# reprocessing 12+ years of history each time, these functions keep a small
+# JSON manifest per file recording how many bytes of it were processed, a
+# fingerprint of those bytes, and the state needed to carry on: the last 49
+# closes for the Bollinger cleaner, the last few days of bars and the trades
+# that may still change for the backtest.  A rerun reads only the bytes after
+# the recorded offset.
+#
+# The fingerprint is a BLAKE2b hash of every processed byte, taken in the same
+# pass that hashes the new end of the file, so rereading costs far less than
+# reparsing.  If the processed part of the file changed anywhere (it shrank,
+# or a single price was rewritten upstream), or the parameters changed, or an
+# output went missing, the file is rebuilt from scratch and a fresh manifest
+# is written.
+#
+#     python incremental.py clean                  # every .txt file in INPUT_FOLDER
+#     python incremental.py backtest INPUT OUTPUT  # e.g. ../Price_Data/AAPL_... aapl_trades.csv
+
+BLOCK_BYTES = 1 << 20
+
+# Calendar days of bars kept before the provisional trades, enough to reach the
+# previous session across weekends and the longest market closures
+TAIL_DAYS = 10
+
+state_folder = os.getenv('STATE_FOLDER', 'output/state')
+
+logger = logging.getLogger(__name__)
+
+
+def _complete_length(path):
+    # Size of the file up to and including its last newline, so a line that is
+    # still being written is left for the next run
+    with open(path, 'rb') as f:
+        end = f.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(0, end - BLOCK_BYTES)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b'\n')
+            if newline >= 0:
+                return start + newline + 1
+            end = start
+    return 0
+
+
+def _fingerprints(path, lengths):
+    # BLAKE2b of the first `length` bytes for each of the ascending `lengths`,
+    # all in one pass over the file
+    digest = hashlib.blake2b()
+    position = 0
+    fingerprints = []
+    with open(path, 'rb') as f:
+        for length in lengths:
+            while position < length:
+                block = f.read(min(BLOCK_BYTES, length - position))
+                if not block:
+                    break
+                digest.update(block)
+                position += len(block)
+            fingerprints.append(digest.copy().hexdigest())
+    return fingerprints
+
+
+def _load_manifest(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_manifest(path, manifest):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def _prefix_unchanged(path, manifest, params, end):
+    # Whether the file still starts with exactly the bytes processed last time,
+    # and the fingerprint of its first `end` bytes for the next manifest
+    if manifest is None or manifest.get('params') != params or manifest['offset'] > end:
+        return False, _fingerprints(path, [end])[0]
+    prefix, fingerprint = _fingerprints(path, [manifest['offset'], end])
+    return prefix == manifest['fingerprint'], fingerprint
+
+
+def read_appended_rows(path, offset, end):
+    """Parse the rows stored between byte ``offset`` and ``end`` of a Price_Data file."""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        raw = f.read(end - offset)
+    if not raw.strip():
+        return pd.DataFrame(columns=COLUMNS[1:], index=pd.DatetimeIndex([], name='datetime'), dtype=float)
+    rows = read_price_csv(io.BytesIO(raw))
+    if not pd.api.types.is_datetime64_any_dtype(rows['datetime']):
+        raise ValueError(f"Appended rows in {path} are not 1-minute price rows")
+    rows.sort_values(by='datetime', inplace=True)
+    return rows.set_index('datetime')
+
+
+def update_cleaned_file(file_path, output_folder_filtered, output_folder_analysis, state_folder=state_folder):
+    """Bring the cleaner's outputs for ``file_path`` up to date with its appended rows."""
+    manifest_path = os.path.join(state_folder, os.path.basename(file_path) + '.clean.json')
+    manifest = _load_manifest(manifest_path)
+    end = _complete_length(file_path)
+    filtered_output_path, analysis_output_path = _output_paths(file_path, output_folder_filtered, output_folder_analysis)
+
+    reason = None
+    unchanged, fingerprint = _prefix_unchanged(file_path, manifest, BAND_PARAMS, end)
+    if not unchanged:
+        reason = 'no manifest, changed parameters or rewritten history'
+    elif manifest['weird_candles'] and not (os.path.exists(filtered_output_path) and os.path.exists(analysis_output_path)):
+        reason = 'outputs missing'
+    else:
+        new = read_appended_rows(file_path, manifest['offset'], end)
+        if new.empty:
+            logger.info("%s is up to date.", file_path)
+            return manifest
+        if new.index[0] < pd.Timestamp(manifest['last_timestamp']):
+            reason = 'appended rows are older than the processed history'
+        else:
+            add_bollinger_bands(new, np.array(manifest['history']))
+            weird = find_weird_candles(new)
+            if weird.empty or manifest['weird_candles']:
+                # The filtered output only exists once a weird candle has been found
+                if manifest['weird_candles']:
+                    new.drop(index=weird['datetime']).to_csv(filtered_output_path, mode='a', header=False)
+                    weird.to_csv(analysis_output_path, mode='a', header=False, index=False)
+                history = np.concatenate([manifest['history'], new['close'].to_numpy()])[-(WINDOW - 1):]
+                manifest.update(
+                    offset=end,
+                    fingerprint=fingerprint,
+                    rows=manifest['rows'] + len(new),
+                    weird_candles=manifest['weird_candles'] + len(weird),
+                    last_timestamp=str(new.index[-1]),
+                    history=history.tolist(),
+                )
+                _save_manifest(manifest_path, manifest)
+                logger.info("Appended %d rows (%d weird candles) from %s", len(new), len(weird), file_path)
+                return manifest
+            reason = 'first weird candle found, the filtered output must be written in full'
+
+    logger.info("Rebuilding cleaner outputs for %s (%s)...", file_path, reason)
+    summary = process_file_streaming(file_path, output_folder_filtered, output_folder_analysis)
+    manifest = {
+        'params': BAND_PARAMS,
+        'offset': end,
+        'fingerprint': fingerprint,
+        'rows': summary['rows'],
+        'weird_candles': summary['weird_candles'],
+        'last_timestamp': str(summary['last_timestamp']),
+        'history': summary['history'].tolist(),
+    }
+    _save_manifest(manifest_path, manifest)
+    return manifest
+
+
+def _write_trades(output_file, settled, provisional, settled_bytes=None):
+    # Settled trades are final.  Provisional ones (signal days whose next session
+    # may still be incomplete) go after them and are rewritten on the next run,
+    # so the file is truncated back to `settled_bytes` first.
+    with open(output_file, 'wb' if settled_bytes is None else 'r+b') as f:
+        if settled_bytes is None:
+            settled.to_csv(f, index=False)
+        else:
+            f.seek(settled_bytes)
+            f.truncate()
+            settled.to_csv(f, index=False, header=False)
+        settled_bytes = f.tell()
+        provisional.to_csv(f, index=False, header=False)
+    return settled_bytes
+
+
+def update_backtest(input_file, output_file, start_date=backtest.start_date,
+                    drawdown_levels=backtest.drawdown_levels, stop_loss_levels=backtest.stop_loss_levels):
+    """Bring ``output_file`` up to date with the rows appended to ``input_file``.
+
+    A signal day's trades depend only on that day, the previous session and
+    the day after, so only the last TAIL_DAYS of bars (kept next to the output
+    as ``.tail.csv``) are rerun together with the new rows.  Trades from the last
+    two processed days are provisional and kept at the end of the file.  Rows
+    are in (drawdown, stop_loss, date) order within each appended block rather
+    than across the whole file.  Bars from TAIL_DAYS before ``start_date`` are
+    loaded too, so a gap-up on the first day is measured against the previous
+    session like in a full backtest.py run.
+    """
+    manifest_path = output_file + '.manifest.json'
+    tail_path = output_file + '.tail.csv'
+    params = {
+        'start_date': start_date,
+        'drawdown_levels': list(drawdown_levels),
+        'stop_loss_levels': list(stop_loss_levels),
+    }
+    manifest = _load_manifest(manifest_path)
+    end = _complete_length(input_file)
+
+    data = None
+    unchanged, fingerprint = _prefix_unchanged(input_file, manifest, params, end)
+    if unchanged and os.path.exists(output_file) and os.path.exists(tail_path):
+        new = read_appended_rows(input_file, manifest['offset'], end)[backtest.price_columns]
+        if new.empty:
+            logger.info("%s is up to date.", output_file)
+            return manifest
+        tail = pd.read_csv(tail_path, index_col='datetime', parse_dates=['datetime'])
+        if tail.empty or new.index[0] > tail.index[-1]:
+            data = pd.concat([tail, new])
+            settled_bytes = manifest['settled_bytes']
+
+    if data is None:
+        logger.info("Rebuilding backtest for %s...", input_file)
+        warmup_start = pd.Timestamp(start_date) - pd.Timedelta(days=TAIL_DAYS)
+        data = backtest.load_data(input_file, warmup_start, backtest.price_columns)
+        settled_bytes = None
+
+    # The rollup includes the warmup bars, so the first day has a previous session
+    rollup = build_rollup(data)
+    in_range = data[data.index >= start_date]
+    trades = backtest.run_backtest(in_range, drawdown_levels, stop_loss_levels,
+                                   backtest.find_signals(in_range, rollup))
+    if settled_bytes is not None:
+        trades = trades[trades['entry_datetime'] >= pd.Timestamp(manifest['settle_from'])]
+
+    if in_range.empty:
+        # Nothing from start_date onward yet; write the header and rebuild next time
+        _write_trades(output_file, trades, trades.iloc[:0])
+        return None
+
+    settle_from = in_range.index[-1].normalize() - pd.Timedelta(days=1)
+    provisional = trades['entry_datetime'] >= settle_from
+    settled_bytes = _write_trades(output_file, trades[~provisional], trades[provisional], settled_bytes)
+    data[data.index >= settle_from - pd.Timedelta(days=TAIL_DAYS)].to_csv(tail_path)
+
+    manifest = {
+        'params': params,
+        'offset': end,
+        'fingerprint': fingerprint,
+        'last_timestamp': str(data.index[-1]),
+        'settle_from': str(settle_from),
+        'settled_bytes': settled_bytes,
+    }
+    _save_manifest(manifest_path, manifest)
+    logger.info("%d trades written to '%s' (%d provisional).", len(trades), output_file, int(provisional.sum()))
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process only the rows appended since the last run.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    clean = commands.add_parser('clean', help="Update the clearing-candle cleaner outputs")
+    clean.add_argument('files', nargs='*', help="Price files (default: every .txt file in INPUT_FOLDER)")
+    run = commands.add_parser('backtest', help="Update a backtest trade CSV")
+    run.add_argument('input_file')
+    run.add_argument('output_file')
+    args = parser.parse_args()
+    configure_logging()
+
+    if args.command == 'clean':
+        files = args.files or [
+            os.path.join(input_folder, name) for name in sorted(os.listdir(input_folder)) if name.endswith('.txt')
+        ]
+        for file_path in files:
+            update_cleaned_file(file_path, output_folder_filtered, output_folder_analysis)
+    else:
+        update_backtest(args.input_file, args.output_file)
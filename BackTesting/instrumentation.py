@@ -0,0 +1,139 @@
+import contextlib
+import cProfile
+import io
+import logging
+import os
+import pstats
+import time
+from collections import defaultdict
+
+import pandas as pd
+
+# Logging, stage timers, counters and profiling shared by the BackTesting scripts.
+#
+# Library code logs through `logging.getLogger(__name__)`: progress at INFO,
+# anything inside a per-drawdown or per-chunk loop at DEBUG, so the default
+# level stays quiet in the hot paths.  Set BACKTEST_LOG_LEVEL=DEBUG to see
+# them, or WARNING to see only problems.
+#
+# Timers and counters go to the current RunReport, one per ticker:
+#
+#     with instrumentation.run("AAPL") as report:
+#         with instrumentation.stage("load"):
+#             data = load_data(...)
+#         instrumentation.count("signals", len(signals))
+#     log_reports([report])
+#
+# Outside of `run(...)` they go to a default report that nobody reads, so the
+# library functions can be called without any setup.  Set
+# BACKTEST_PROFILE_DIR to also write a cProfile file per run
+# (`<dir>/<ticker>.prof`, open with `python -m pstats` or snakeviz).
+
+LOG_LEVEL = os.getenv('BACKTEST_LOG_LEVEL', 'INFO')
+PROFILE_DIR = os.getenv('BACKTEST_PROFILE_DIR')
+
+logger = logging.getLogger(__name__)
+
+
+def configure_logging(level=LOG_LEVEL):
+    # Called once by each script's __main__ block
+    logging.basicConfig(level=level, format="%(asctime)s %(levelname)s %(message)s")
+
+
+class RunReport:
+    """Wall time per stage and event counters for one ticker (or one run)."""
+
+    def __init__(self, label=""):
+        self.label = label
+        self.timings = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.started = time.perf_counter()
+        self.seconds = None
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] += time.perf_counter() - started
+
+    def count(self, name, n=1):
+        self.counters[name] += int(n)
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self.started
+        return self
+
+    def as_dict(self):
+        # Flat row for the report table: ticker, total seconds, <stage>_s..., counters...
+        row = {"ticker": self.label, "seconds": self.seconds}
+        row.update({f"{name}_s": seconds for name, seconds in self.timings.items()})
+        row.update(self.counters)
+        return row
+
+
+_current = RunReport()
+
+
+def current():
+    return _current
+
+
+def stage(name):
+    # Time a block into the current report
+    return _current.stage(name)
+
+
+def count(name, n=1):
+    _current.count(name, n)
+
+
+@contextlib.contextmanager
+def run(label, profile_dir=PROFILE_DIR):
+    """Collect timings and counters for ``label`` (optionally under cProfile) until the block exits."""
+    global _current
+    previous, _current = _current, RunReport(label)
+    profiler = cProfile.Profile() if profile_dir else None
+    if profiler:
+        profiler.enable()
+    try:
+        yield _current
+    finally:
+        if profiler:
+            profiler.disable()
+            os.makedirs(profile_dir, exist_ok=True)
+            path = os.path.join(profile_dir, f"{label or 'run'}.prof")
+            profiler.dump_stats(path)
+            if logger.isEnabledFor(logging.DEBUG):
+                text = io.StringIO()
+                pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(15)
+                logger.debug("Profile of %s:\n%s", label, text.getvalue())
+            logger.info("Profile written to %s", path)
+        _current.finish()
+        _current = previous
+
+
+def report_frame(reports):
+    """One row per report (RunReport or its as_dict()), stage columns first, then counters."""
+    rows = [r.as_dict() if isinstance(r, RunReport) else r for r in reports]
+    frame = pd.DataFrame(rows)
+    if frame.empty:
+        return frame
+    stages = [c for c in frame.columns if c.endswith("_s")]
+    counters = [c for c in frame.columns if c not in stages and c not in ("ticker", "seconds")]
+    frame = frame[["ticker", "seconds"] + stages + counters]
+    frame[counters] = frame[counters].fillna(0).astype("int64")
+    return frame
+
+
+def log_reports(reports, path=None):
+    # Log the per-ticker timing and counter table, and optionally save it as CSV
+    frame = report_frame(reports)
+    if frame.empty:
+        return frame
+    logger.info("Per-ticker report:\n%s", frame.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+    if path:
+        frame.to_csv(path, index=False)
+        logger.info("Per-ticker report saved to '%s'", path)
+    return frame
@@ -0,0 +1,145 @@
+import numpy as np
+import pandas as pd
+
+# Session-aligned layout for regular-hours 1-minute bars.
+#
+# Instead of a long DataFrame indexed by timestamp, each price field becomes a
+# (trading_days x session_minutes) array: row r is one trading day and column c
+# is the bar at `session_start + c` minutes.  "The 11:15 bar" is then a fixed
+# column, "the next session" is the next row, and day-level logic (opens,
+# closes, highs, lows, threshold crossings) runs as 2D array operations with no
+# time-based lookups.  Missing bars are NaN and False in `mask`.
+#
+# The session runs from 09:30 through the 16:00 bar inclusive, the same window
+# backtest.py uses for the daily open and close, which gives 391 columns.
+
+SESSION_START = "09:30"
+SESSION_END = "16:00"
+FIELDS = ("open", "high", "low", "close")
+
+NS_PER_MINUTE = pd.Timedelta(minutes=1).value
+NS_PER_DAY = pd.Timedelta(days=1).value
+
+
+class MinuteMatrix:
+    """Regular-session bars of one ticker as (trading_days x minutes) arrays.
+
+    ``days`` is the trading-day calendar (one row per day), ``mask`` marks
+    which bars exist and ``values[field]`` holds the prices, NaN where a bar
+    is missing.
+    """
+
+    def __init__(self, days, mask, values, session_start=SESSION_START):
+        self.days = days
+        self.mask = mask
+        self.values = values
+        self.session_start = pd.Timedelta(f"{session_start}:00")
+
+    def __getitem__(self, field):
+        return self.values[field]
+
+    @property
+    def shape(self):
+        return self.mask.shape
+
+    @property
+    def nbytes(self):
+        return self.mask.nbytes + sum(v.nbytes for v in self.values.values())
+
+    def column(self, time_of_day):
+        # "11:15" -> column index of the 11:15 bar
+        return int((pd.Timedelta(f"{time_of_day}:00") - self.session_start) // pd.Timedelta(minutes=1))
+
+    def row(self, date):
+        # Row of a trading day, or -1 if it is not in the calendar
+        position = self.days.searchsorted(pd.Timestamp(date).normalize())
+        if position < len(self.days) and self.days[position] == pd.Timestamp(date).normalize():
+            return int(position)
+        return -1
+
+    def at(self, field, time_of_day):
+        # One value per day for a fixed bar, e.g. the 11:15 close; NaN where the bar is missing
+        return self.values[field][:, self.column(time_of_day)]
+
+    def next_rows(self, calendar_days=False):
+        """Row of the following session for each day, -1 where there is none.
+
+        With ``calendar_days=True`` the following session must fall on the
+        next calendar day (the rule backtest.py applies to exits).
+        """
+        following = np.arange(1, len(self.days) + 1)
+        following[-1:] = -1
+        if calendar_days and len(self.days) > 1:
+            gap = np.diff(self.days.values).astype("timedelta64[D]").astype(np.int64)
+            following[:-1][gap != 1] = -1
+        return following
+
+    def first_bar(self, field):
+        # Value of the first existing bar of each day (e.g. the session open)
+        has_bar = self.mask.any(axis=1)
+        first = self.mask.argmax(axis=1)
+        return np.where(has_bar, self.values[field][np.arange(len(first)), first], np.nan)
+
+    def last_bar(self, field):
+        # Value of the last existing bar of each day (e.g. the session close)
+        has_bar = self.mask.any(axis=1)
+        last = self.mask.shape[1] - 1 - self.mask[:, ::-1].argmax(axis=1)
+        return np.where(has_bar, self.values[field][np.arange(len(last)), last], np.nan)
+
+    def daily_summary(self):
+        """Session open, high, low, close and bar count per trading day."""
+        has_bar = self.mask.any(axis=1)
+        high = np.where(self.mask, self.values["high"], -np.inf).max(axis=1) if "high" in self.values else None
+        low = np.where(self.mask, self.values["low"], np.inf).min(axis=1) if "low" in self.values else None
+        summary = pd.DataFrame(index=self.days.rename("date"))
+        if "open" in self.values:
+            summary["open"] = self.first_bar("open")
+        if high is not None:
+            summary["high"] = np.where(has_bar, high, np.nan)
+        if low is not None:
+            summary["low"] = np.where(has_bar, low, np.nan)
+        if "close" in self.values:
+            summary["close"] = self.last_bar("close")
+        summary["bars"] = self.mask.sum(axis=1)
+        return summary
+
+
+def build_minute_matrix(data, fields=FIELDS, dtype=np.float32, calendar=None,
+                        session_start=SESSION_START, session_end=SESSION_END):
+    """Reshape a datetime-indexed 1-minute frame into a MinuteMatrix.
+
+    Bars outside ``session_start``-``session_end`` (inclusive) are dropped.
+    Rows are the days that have at least one session bar, or ``calendar``
+    when given (days in it without bars are fully masked).  ``float32``
+    halves memory against the float64 frame; pass ``np.float64`` when exact
+    comparisons with prices from the CSV matter.
+    """
+    ts = data.index.values.astype("datetime64[ns]").view(np.int64)
+    start = pd.Timedelta(f"{session_start}:00").value
+    end = pd.Timedelta(f"{session_end}:00").value
+    width = (end - start) // NS_PER_MINUTE + 1
+
+    day = ts - ts % NS_PER_DAY
+    time_of_day = ts - day
+    rows_in_session = np.flatnonzero((time_of_day >= start) & (time_of_day <= end))
+    day = day[rows_in_session]
+    column = (time_of_day[rows_in_session] - start) // NS_PER_MINUTE
+
+    if calendar is None:
+        days = pd.DatetimeIndex(np.unique(day).astype("datetime64[ns]"))
+    else:
+        days = pd.DatetimeIndex(calendar).normalize().unique().sort_values()
+    day_ns = days.values.astype("datetime64[ns]").view(np.int64)
+    row = np.searchsorted(day_ns, day)
+    on_calendar = row < len(day_ns)
+    on_calendar[on_calendar] = day_ns[row[on_calendar]] == day[on_calendar]
+    row, column, rows_in_session = row[on_calendar], column[on_calendar], rows_in_session[on_calendar]
+
+    mask = np.zeros((len(days), width), dtype=bool)
+    mask[row, column] = True
+    values = {}
+    for field in fields:
+        matrix = np.full((len(days), width), np.nan, dtype=dtype)
+        matrix[row, column] = data[field].to_numpy()[rows_in_session]
+        values[field] = matrix
+    return MinuteMatrix(days, mask, values, session_start)
@@ -0,0 +1,129 @@
+import argparse
+import functools
+import logging
+import os
+import time
+
+import pandas as pd
+
+import backtest
+import instrumentation
+from daily_rollup import build_rollup
+from Identify_and_Remove_Clearing_Candles import WINDOW, add_bollinger_bands, find_weird_candles, save_outputs
+from instrumentation import configure_logging, count, log_reports, stage
+from price_cache import COLUMNS, list_input_files, load_prices, price_data_folder, ticker_from_path
+from run_universe import run_universe
+from trade_sink import TradeSink
+
+# Clean and backtest in one pass, without the filtered CSV in between.
+#
+#     python pipeline.py                                       # every file in ../Price_Data
+#     python pipeline.py AAPL MSFT --workers 2
+#     python pipeline.py ../Price_Data --filtered-dir output/filtered_data --analysis-dir output/weird_candles_analysis
+#
+# Each ticker is loaded once (through the columnar cache when it is up to
+# date), the clearing candles are flagged and dropped in memory, and the
+# cleaned frame goes straight into backtest.find_signals / run_backtest.  The
+# cleaner's filtered data and weird-candle analysis are only written when their
+# folders are given; in that case the whole history is loaded so the files match
+# what Identify_and_Remove_Clearing_Candles.py writes.
+
+# Calendar days loaded before start_date so the first bands have a full
+# WINDOW of closes and the first day has a previous session
+WARMUP_DAYS = 30
+
+BAR_COLUMNS = ["open", "high", "low", "close"]
+
+logger = logging.getLogger(__name__)
+
+
+def load_with_warmup(path, start_date, columns=BAR_COLUMNS):
+    # Bars from WARMUP_DAYS before start_date, or the whole file if that does
+    # not reach WINDOW - 1 earlier closes
+    start = pd.Timestamp(start_date)
+    data = load_prices(path, start=start - pd.Timedelta(days=WARMUP_DAYS), columns=columns)
+    if (data.index < start).sum() < WINDOW - 1:
+        data = load_prices(path, columns=columns)
+    return data
+
+
+def clean_and_backtest(path, start_date, drawdown_levels, stop_loss_levels,
+                       output_folder_filtered=None, output_folder_analysis=None):
+    """Remove the clearing candles from ``path`` in memory and backtest the result.
+
+    Returns ``(trades, report)`` like run_universe.backtest_ticker, with the
+    report's ``rows`` the number of cleaned bars from ``start_date`` onward.
+    """
+    ticker = ticker_from_path(path)
+    with instrumentation.run(ticker) as report:
+        with stage("load"):
+            if output_folder_filtered or output_folder_analysis:
+                data = load_prices(path, columns=COLUMNS)
+            else:
+                data = load_with_warmup(path, start_date)
+
+        with stage("bands"):
+            add_bollinger_bands(data)
+        with stage("flag"):
+            weird = find_weird_candles(data)
+        count("weird_candles", len(weird))
+        logger.info("[%s] %d weird candles removed", ticker, len(weird))
+        if output_folder_filtered or output_folder_analysis:
+            save_outputs(data, weird, path, output_folder_filtered, output_folder_analysis)
+
+        cleaned = data.drop(index=weird["datetime"])[BAR_COLUMNS]
+        with stage("rollup"):
+            rollup = build_rollup(cleaned)
+        cleaned = cleaned[cleaned.index >= start_date]
+        count("rows", len(cleaned))
+        signals = backtest.find_signals(cleaned, rollup)
+        trades = backtest.run_backtest(cleaned, drawdown_levels, stop_loss_levels, signals)
+        trades.insert(0, "ticker", ticker)
+    return trades, report.as_dict()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Remove clearing candles and backtest in one pass.")
+    parser.add_argument("sources", nargs="*", default=[price_data_folder],
+                        help="Price_Data directories, files or ticker symbols (default: %(default)s)")
+    parser.add_argument("--output", default="pipeline_trade_details.csv",
+                        help="Merged trade CSV (default: %(default)s)")
+    parser.add_argument("--summary", default=None,
+                        help="Also write per-(ticker, drawdown, stop_loss) statistics to this CSV")
+    parser.add_argument("--report", default=None,
+                        help="Also write per-ticker stage timings and counters to this CSV")
+    parser.add_argument("--start-date", default=backtest.start_date)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="Worker processes, one ticker each (default: all cores)")
+    parser.add_argument("--memory-limit-gb", type=float, default=None,
+                        help="Address-space cap per worker; a ticker over it fails instead of swapping")
+    parser.add_argument("--filtered-dir", default=None,
+                        help="Also write the filtered data here, like the cleaner's OUTPUT_FOLDER_FILTERED")
+    parser.add_argument("--analysis-dir", default=None,
+                        help="Also write the weird candle analysis here, like OUTPUT_FOLDER_ANALYSIS")
+    args = parser.parse_args()
+    configure_logging()
+
+    paths = list_input_files(args.sources)
+    logger.info("Cleaning and backtesting %d files with %d workers...", len(paths), args.workers)
+    started = time.perf_counter()
+    with TradeSink(args.output, columns=["ticker"] + backtest.TRADE_COLUMNS) as sink:
+        _, failures, reports = run_universe(
+            paths,
+            args.start_date,
+            backtest.drawdown_levels,
+            backtest.stop_loss_levels,
+            workers=args.workers,
+            memory_limit_bytes=int(args.memory_limit_gb * 1024 ** 3) if args.memory_limit_gb else None,
+            task=functools.partial(clean_and_backtest, output_folder_filtered=args.filtered_dir,
+                                   output_folder_analysis=args.analysis_dir),
+            sink=sink,
+        )
+    logger.info("%d trades from %d tickers saved to '%s' in %.1fs.", sink.rows, len(paths) - len(failures),
+                sink.path, time.perf_counter() - started)
+    if args.summary:
+        sink.summary().to_csv(args.summary, index=False)
+        logger.info("Per-ticker, per-combination summary saved to '%s'.", args.summary)
+    log_reports(reports, args.report)
+    if failures:
+        logger.warning("Skipped %d tickers: %s", len(failures), ", ".join(sorted(failures)))
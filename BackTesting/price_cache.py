@@ -0,0 +1,250 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Columnar cache for the Price_Data 1-minute files.
+#
+# Each file is stored once as one .npy file per column per year:
+#
+#     <PRICE_CACHE_DIR>/AAPL_1a2b3c4d/meta.json
+#     <PRICE_CACHE_DIR>/AAPL_1a2b3c4d/2012/datetime.npy, open.npy, high.npy, ...
+#
+# The folder name is the ticker plus a hash of the file's absolute path, so
+# files that share a ticker (Price_Data/AAPL_... and the cleaner's filtered
+# AAPL_..., say) each keep their own cache instead of replacing each other's.
+#
+# The files are memory-mapped on load, so reading a date range only touches
+# the years (and, within them, the rows) that fall inside it, and only the
+# requested columns are read at all.
+#
+# Convert every file once with `python price_cache.py` (or pass file paths),
+# then load with `load_prices(path, start=..., columns=[...])`.  If a file has
+# no cache yet, or has changed since it was converted, `load_prices` falls back
+# to parsing the CSV.
+
+COLUMNS = ["datetime", "open", "high", "low", "close", "volume"]
+
+price_data_folder = os.getenv('PRICE_DATA_FOLDER', '../Price_Data')
+cache_root = os.getenv('PRICE_CACHE_DIR', '../Price_Cache')
+
+logger = logging.getLogger(__name__)
+
+
+def ticker_from_path(path):
+    # "Price_Data/AAPL_2012_onward_1min_UNADJUSTED.txt" -> "AAPL"
+    return os.path.basename(path).split("_")[0]
+
+
+def list_input_files(sources):
+    """Resolve directories, file paths and bare ticker symbols to Price_Data files."""
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            paths.extend(
+                os.path.join(source, name)
+                for name in sorted(os.listdir(source))
+                if name.endswith(".txt")
+            )
+        elif os.path.isfile(source):
+            paths.append(source)
+        else:
+            matches = [
+                os.path.join(price_data_folder, name)
+                for name in sorted(os.listdir(price_data_folder))
+                if name.endswith(".txt") and ticker_from_path(name) == source
+            ]
+            if not matches:
+                raise FileNotFoundError(f"No file for ticker {source} in {price_data_folder}")
+            paths.extend(matches)
+    return paths
+
+
+def cache_dir_for(path, root=None):
+    digest = hashlib.blake2b(os.path.abspath(path).encode(), digest_size=4).hexdigest()
+    return os.path.join(root or cache_root, f"{ticker_from_path(path)}_{digest}")
+
+
+def source_signature(path):
+    stat = os.stat(path)
+    return {"source_size": stat.st_size, "source_mtime_ns": stat.st_mtime_ns}
+
+
+def _read_meta(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, "meta.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_fresh(path, root=None):
+    """True if the cache for ``path`` exists and was built from the file as it is now."""
+    meta = _read_meta(cache_dir_for(path, root))
+    if meta is None or meta.get("source") != os.path.abspath(path):
+        return False
+    signature = source_signature(path)
+    return all(meta.get(key) == value for key, value in signature.items())
+
+
+def read_price_csv(path, columns=None, chunksize=None):
+    # Parse a Price_Data file: no header, datetime,open,high,low,close,volume
+    usecols = None if columns is None else ["datetime"] + [c for c in columns if c != "datetime"]
+    return pd.read_csv(
+        path,
+        header=None,
+        names=COLUMNS,
+        usecols=usecols,
+        parse_dates=["datetime"],
+        chunksize=chunksize,
+    )
+
+
+def _check_parsed(chunk, path):
+    if not pd.api.types.is_datetime64_any_dtype(chunk["datetime"]):
+        raise ValueError(f"{path} is not a 1-minute price file (is it still a Git LFS pointer?)")
+
+
+def _write_year(year_dir, frames):
+    year = pd.concat(frames, ignore_index=True)
+    if os.path.isdir(year_dir):
+        # The source was not sorted by year: merge with what was already flushed
+        previous = pd.DataFrame({c: np.load(os.path.join(year_dir, f"{c}.npy")) for c in COLUMNS})
+        year = pd.concat([previous, year], ignore_index=True)
+    year.sort_values(by="datetime", inplace=True, kind="mergesort")
+    os.makedirs(year_dir, exist_ok=True)
+    for column in COLUMNS:
+        values = year[column].to_numpy()
+        if column == "datetime":
+            values = values.astype("datetime64[ns]")
+        np.save(os.path.join(year_dir, f"{column}.npy"), values)
+    return len(year)
+
+
+def convert_file(path, root=None, chunksize=1_000_000):
+    """Convert one Price_Data CSV into the per-year columnar cache and return its directory."""
+    signature = source_signature(path)
+    final_dir = cache_dir_for(path, root)
+    build_dir = final_dir + ".tmp"
+    shutil.rmtree(build_dir, ignore_errors=True)
+    os.makedirs(build_dir)
+
+    logger.info("Converting %s to columnar cache...", path)
+    pending = {}
+    rows = 0
+    for chunk in read_price_csv(path, chunksize=chunksize):
+        _check_parsed(chunk, path)
+        years = chunk["datetime"].dt.year
+        for year, frame in chunk.groupby(years, sort=True):
+            pending.setdefault(int(year), []).append(frame)
+        # Files are in time order, so earlier years are complete and can be written out
+        for year in [y for y in pending if y < years.min()]:
+            rows += _write_year(os.path.join(build_dir, str(year)), pending.pop(year))
+    for year in sorted(pending):
+        rows += _write_year(os.path.join(build_dir, str(year)), pending.pop(year))
+
+    years = sorted(int(name) for name in os.listdir(build_dir) if name.isdigit())
+    meta = dict(signature, source=os.path.abspath(path), rows=rows, years=years, columns=COLUMNS)
+    with open(os.path.join(build_dir, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+
+    shutil.rmtree(final_dir, ignore_errors=True)
+    os.replace(build_dir, final_dir)
+    logger.info("Cached %d rows across %d years in %s", rows, len(years), final_dir)
+    return final_dir
+
+
+def _load_cached(cache_dir, years, start, end, columns):
+    frames = []
+    for year in years:
+        year_dir = os.path.join(cache_dir, str(year))
+        datetimes = np.load(os.path.join(year_dir, "datetime.npy"), mmap_mode="r")
+        lo = 0 if start is None else np.searchsorted(datetimes, start.to_datetime64())
+        hi = len(datetimes) if end is None else np.searchsorted(datetimes, end.to_datetime64())
+        if lo >= hi:
+            continue
+        frame = {"datetime": np.array(datetimes[lo:hi])}
+        for column in columns:
+            frame[column] = np.array(np.load(os.path.join(year_dir, f"{column}.npy"), mmap_mode="r")[lo:hi])
+        frames.append(pd.DataFrame(frame))
+    if not frames:
+        return pd.DataFrame({c: np.array([], dtype="datetime64[ns]" if c == "datetime" else float) for c in ["datetime"] + columns})
+    return pd.concat(frames, ignore_index=True)
+
+
+def load_prices(path, start=None, end=None, columns=None, root=None):
+    """Load ``path`` as a DataFrame indexed by datetime, sorted in time order.
+
+    Only rows with ``start <= datetime < end`` and only ``columns`` (default:
+    all of open/high/low/close/volume) are read.  Uses the columnar cache when
+    it is up to date, otherwise parses the CSV.
+    """
+    columns = [c for c in (columns or COLUMNS) if c != "datetime"]
+    start = None if start is None else pd.Timestamp(start)
+    end = None if end is None else pd.Timestamp(end)
+    cache_dir = cache_dir_for(path, root)
+
+    if is_fresh(path, root):
+        meta = _read_meta(cache_dir)
+        first_year = meta["years"][0] if start is None else start.year
+        last_year = meta["years"][-1] if end is None else (end - pd.Timedelta(1)).year
+        years = [y for y in meta["years"] if first_year <= y <= last_year]
+        data = _load_cached(cache_dir, years, start, end, columns)
+    else:
+        data = read_price_csv(path, columns=columns)
+        _check_parsed(data, path)
+        data.sort_values(by="datetime", inplace=True)
+        if start is not None:
+            data = data[data["datetime"] >= start]
+        if end is not None:
+            data = data[data["datetime"] < end]
+
+    data.set_index("datetime", inplace=True)
+    return data
+
+
+def iter_prices(path, chunksize=500_000, columns=None, root=None):
+    """Yield ``path`` in time order as datetime-indexed frames of at most ``chunksize`` rows.
+
+    Slices the memory-mapped cache when it is up to date, otherwise streams
+    the CSV, so memory stays bounded by the chunk size either way.
+    """
+    columns = [c for c in (columns or COLUMNS) if c != "datetime"]
+    if is_fresh(path, root):
+        cache_dir = cache_dir_for(path, root)
+        for year in _read_meta(cache_dir)["years"]:
+            year_dir = os.path.join(cache_dir, str(year))
+            datetimes = np.load(os.path.join(year_dir, "datetime.npy"), mmap_mode="r")
+            arrays = {c: np.load(os.path.join(year_dir, f"{c}.npy"), mmap_mode="r") for c in columns}
+            for lo in range(0, len(datetimes), chunksize):
+                hi = lo + chunksize
+                chunk = pd.DataFrame({c: np.array(a[lo:hi]) for c, a in arrays.items()},
+                                     index=pd.DatetimeIndex(np.array(datetimes[lo:hi]), name="datetime"))
+                yield chunk
+        return
+
+    for chunk in read_price_csv(path, columns=columns, chunksize=chunksize):
+        _check_parsed(chunk, path)
+        yield chunk.set_index("datetime")
+
+
+if __name__ == "__main__":
+    from instrumentation import configure_logging
+    configure_logging()
+    # Convert the files given on the command line, or every .txt file in price_data_folder
+    paths = sys.argv[1:] or [
+        os.path.join(price_data_folder, name)
+        for name in sorted(os.listdir(price_data_folder))
+        if name.endswith(".txt")
+    ]
+    for path in paths:
+        if is_fresh(path):
+            logger.info("Cache for %s is up to date, skipping.", path)
+            continue
+        convert_file(path)
+    logger.info("All files converted.")
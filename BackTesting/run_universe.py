@@ -0,0 +1,161 @@
+import argparse
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+import backtest
+import instrumentation
+from daily_rollup import load_rollup
+from instrumentation import configure_logging, log_reports, stage
+from price_cache import list_input_files, price_data_folder, ticker_from_path
+from trade_sink import TradeSink
+
+# Run the backtest over many tickers at once, one ticker per worker process.
+#
+#     python run_universe.py                              # every file in ../Price_Data
+#     python run_universe.py ../Price_Data --workers 16
+#     python run_universe.py AAPL MSFT NFLX --memory-limit-gb 4
+#
+# Each worker loads one ticker, runs backtest.run_backtest with the levels set
+# in backtest.py and exits, so its memory goes back to the OS before the next
+# ticker starts.  That needs Python 3.11+ (`max_tasks_per_child`, which also
+# switches the pool to the "spawn" start method, so every ticker pays for a
+# fresh interpreter and pandas import); on older versions workers are reused
+# and --memory-limit-gb is what keeps one ticker from exhausting memory.  A file that fails to load or backtest is reported and
+# skipped; the other tickers still finish.  The merged trades get a leading
+# `ticker` column and are written as tickers finish (.parquet/.arrow output
+# needs pyarrow).  Each worker also sends back its stage timings and counters,
+# logged as one table at the end (and saved with --report).
+
+logger = logging.getLogger(__name__)
+
+
+def _init_worker(max_bytes):
+    # Runs in each worker: spawned workers start with no logging set up, and
+    # capping the address space makes one huge ticker fail with MemoryError
+    # instead of pushing the whole box into swap
+    configure_logging()
+    if max_bytes:
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS, (max_bytes, max_bytes))
+
+
+def backtest_ticker(path, start_date, drawdown_levels, stop_loss_levels):
+    ticker = ticker_from_path(path)
+    with instrumentation.run(ticker) as report:
+        data = backtest.load_data(path, start_date, backtest.price_columns)
+        with stage("rollup"):
+            rollup = load_rollup(path)
+        signals = backtest.find_signals(data, rollup)
+        trades = backtest.run_backtest(data, drawdown_levels, stop_loss_levels, signals)
+        trades.insert(0, "ticker", ticker)
+    return trades, report.as_dict()
+
+
+def run_universe(paths, start_date, drawdown_levels, stop_loss_levels, workers=None, memory_limit_bytes=None,
+                 task=backtest_ticker, sink=None):
+    """Backtest every file in ``paths`` in parallel and merge the trades.
+
+    ``task`` is called in a worker as ``task(path, start_date, drawdown_levels,
+    stop_loss_levels)`` and returns ``(trades, report)``, ``report`` being the
+    ``as_dict()`` of its instrumentation.RunReport; it must be picklable (a
+    module-level function or a ``functools.partial`` of one).  Returns
+    ``(trades, failures, reports)`` where ``failures`` maps each ticker that
+    could not be processed to its error and ``reports`` lists the other
+    tickers' reports in input order.  With a ``sink`` (a
+    trade_sink.TradeSink) each ticker's trades are written to it, still in
+    input order, as soon as the tickers before it are done, and ``trades`` is
+    None.
+    """
+    results = {}
+    reports = {}
+    failures = {}
+    next_path = 0  # Index in `paths` of the next ticker to hand to the sink
+    # One ticker per worker process where the pool supports it (Python 3.11+)
+    fresh_workers = {"max_tasks_per_child": 1} if sys.version_info >= (3, 11) else {}
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(memory_limit_bytes,),
+        **fresh_workers,
+    ) as pool:
+        futures = {
+            pool.submit(task, path, start_date, drawdown_levels, stop_loss_levels): path
+            for path in paths
+        }
+        finished = set()
+        for future in as_completed(futures):
+            path = futures[future]
+            ticker = ticker_from_path(path)
+            finished.add(path)
+            try:
+                trades, report = future.result()
+            except Exception as e:
+                failures[ticker] = e
+                logger.warning("[%s] failed: %r", ticker, e)
+            else:
+                results[path] = trades
+                reports[path] = report
+                logger.info("[%s] %d rows, %d trades in %.1fs", ticker, report.get("rows", 0), len(trades),
+                            report["seconds"])
+            if sink is not None:
+                # Hand over every ticker whose predecessors are all done, then forget it
+                while next_path < len(paths) and paths[next_path] in finished:
+                    if paths[next_path] in results:
+                        sink.write(results.pop(paths[next_path]))
+                    next_path += 1
+
+    # Keep the input order so the merged file does not depend on scheduling
+    reports = [reports[path] for path in paths if path in reports]
+    if sink is not None:
+        return None, failures, reports
+
+    frames = [results[path] for path in paths if path in results]
+    if not frames:
+        return pd.DataFrame(columns=["ticker"] + backtest.TRADE_COLUMNS), failures, reports
+    return pd.concat(frames, ignore_index=True), failures, reports
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backtest many tickers in parallel.")
+    parser.add_argument("sources", nargs="*", default=[price_data_folder],
+                        help="Price_Data directories, files or ticker symbols (default: %(default)s)")
+    parser.add_argument("--output", default="universe_trade_details.csv",
+                        help="Merged trade CSV (default: %(default)s)")
+    parser.add_argument("--summary", default=None,
+                        help="Also write per-(ticker, drawdown, stop_loss) statistics to this CSV")
+    parser.add_argument("--report", default=None,
+                        help="Also write per-ticker stage timings and counters to this CSV")
+    parser.add_argument("--start-date", default=backtest.start_date)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="Worker processes, one ticker each (default: all cores)")
+    parser.add_argument("--memory-limit-gb", type=float, default=None,
+                        help="Address-space cap per worker; a ticker over it fails instead of swapping")
+    args = parser.parse_args()
+    configure_logging()
+
+    paths = list_input_files(args.sources)
+    logger.info("Backtesting %d files with %d workers...", len(paths), args.workers)
+    started = time.perf_counter()
+    with TradeSink(args.output, columns=["ticker"] + backtest.TRADE_COLUMNS) as sink:
+        _, failures, reports = run_universe(
+            paths,
+            args.start_date,
+            backtest.drawdown_levels,
+            backtest.stop_loss_levels,
+            workers=args.workers,
+            memory_limit_bytes=int(args.memory_limit_gb * 1024 ** 3) if args.memory_limit_gb else None,
+            sink=sink,
+        )
+    logger.info("%d trades from %d tickers saved to '%s' in %.1fs.", sink.rows, len(paths) - len(failures),
+                sink.path, time.perf_counter() - started)
+    if args.summary:
+        sink.summary().to_csv(args.summary, index=False)
+        logger.info("Per-ticker, per-combination summary saved to '%s'.", args.summary)
+    log_reports(reports, args.report)
+    if failures:
+        logger.warning("Skipped %d tickers: %s", len(failures), ", ".join(sorted(failures)))
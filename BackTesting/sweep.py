@@ -0,0 +1,194 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+import instrumentation
+from backtest import TRADE_COLUMNS, _index_ns, _window_matrix, find_signals, load_data, price_columns
+from daily_rollup import load_rollup
+from instrumentation import configure_logging, log_reports, stage
+from price_cache import ticker_from_path
+
+# User Instructions:
+# 1. Set the `input_file` variable to the path of your dataset file.
+# 2. Set `surface_output_file` to where the per-(drawdown, stop_loss) summary should go.
+# 3. Optionally set `trades_output_file` to also write every trade (large for big grids).
+# 4. Adjust the `start_date`, `drawdown_levels`, and `stop_loss_levels` as desired.
+
+# Path to the dataset file
+input_file = "path/to/your/AAPL_1min_data.csv"  # Replace with your file path
+surface_output_file = "path/to/output/backtest_sweep_surface.csv"  # Replace with your desired output path
+trades_output_file = None  # e.g. "path/to/output/backtest_sweep_trades.csv"
+
+start_date = "2020-01-01"  # Modify to your preferred start date
+
+# A 100 x 100 grid costs about the same as a single combination did with the old loop
+drawdown_levels = [x * 0.02 for x in range(1, 101)]  # Test drawdowns [0.02%, 0.04%, ..., 2.0%]
+stop_loss_levels = [x * 0.05 for x in range(1, 101)]  # Test stop-losses [0.05%, 0.1%, ..., 5.0%]
+
+SURFACE_COLUMNS = [
+    "drawdown_level (%)",
+    "stop_loss_level (%)",
+    "signals",
+    "trades",
+    "fill_rate",
+    "win_rate",
+    "profit_target_rate",
+    "stop_loss_rate",
+    "mean_return (%)",
+    "total_return (%)",
+]
+
+# Exit reasons are tracked as small codes while sweeping
+NO_TRADE, STOP_LOSS, PROFIT_TARGET, FINAL_EXIT = 0, 1, 2, 3
+EXIT_REASONS = np.array(["", "Stop-loss", "Profit Target", "Final Exit"])
+
+
+logger = logging.getLogger(__name__)
+
+
+def build_first_passage_index(data, signals):
+    """Precompute, per signal day, the running extremes that answer "when is X first crossed".
+
+    The negated running minimum of the 11:15-16:00 closes is non-decreasing,
+    so the first bar closing at or below any entry price is a ``searchsorted``
+    into it; the same holds for the next day's stop-loss (running minimum) and
+    profit target (running maximum).  ``hold_low`` is the suffix minimum of
+    lows from each entry-window bar through the next day's close.
+    """
+    closes = data["close"].to_numpy()
+    lows = data["low"].to_numpy()
+    entry_start = signals["entry_start"].to_numpy()
+    entry_end = signals["entry_end"].to_numpy()
+    exit_start = signals["exit_start"].to_numpy()
+    exit_end = signals["exit_end"].to_numpy()
+    signal_price = signals["signal_price"].to_numpy()
+
+    entry_window = _window_matrix(closes, entry_start, entry_end, np.inf)
+    exit_low = _window_matrix(closes, exit_start, exit_end, np.inf)
+    exit_high = _window_matrix(closes, exit_start, exit_end, -np.inf)
+    hold_window = _window_matrix(lows, entry_start, exit_end, np.inf)
+
+    exit_max = np.maximum.accumulate(exit_high, axis=1)
+    exit_length = exit_end - exit_start
+    profit_offset = np.array([np.searchsorted(row, price) for row, price in zip(exit_max, signal_price)], dtype=np.int64)
+    has_profit = profit_offset < exit_length
+
+    return {
+        "signal_price": signal_price,
+        "entry_start": entry_start,
+        "entry_length": entry_end - entry_start,
+        "entry_key": -np.minimum.accumulate(entry_window, axis=1),
+        "exit_start": exit_start,
+        "exit_length": exit_length,
+        "exit_key": -np.minimum.accumulate(exit_low, axis=1),
+        "hold_low": np.minimum.accumulate(hold_window[:, ::-1], axis=1)[:, ::-1],
+        # Exit used when the stop-loss never triggers: profit target, else the final bar
+        "fallback_row": np.where(has_profit, exit_start + profit_offset, exit_end - 1),
+        "fallback_reason": np.where(has_profit, PROFIT_TARGET, FINAL_EXIT),
+    }
+
+
+def sweep(data, drawdown_levels, stop_loss_levels, signals=None, with_trades=True):
+    """Evaluate a full drawdown x stop-loss grid with one lookup per signal day.
+
+    Returns ``(surface, trades)``.  ``surface`` has one row per grid cell;
+    ``trades`` matches ``backtest.run_backtest`` row for row, or is ``None``
+    when ``with_trades`` is False.
+    """
+    if signals is None:
+        signals = find_signals(data)
+    signals = signals[signals["exit_start"] < signals["exit_end"]]
+
+    closes = data["close"].to_numpy()
+    index = build_first_passage_index(data, signals)
+    drawdowns = np.asarray(drawdown_levels, dtype=float)
+    stop_losses = np.asarray(stop_loss_levels, dtype=float)
+    n_signals, n_drawdowns, n_stops = len(signals), len(drawdowns), len(stop_losses)
+
+    entry_row = np.full((n_signals, n_drawdowns), -1, dtype=np.int64)
+    lowest_price = np.full((n_signals, n_drawdowns), np.nan)
+    exit_row = np.full((n_signals, n_drawdowns, n_stops), -1, dtype=np.int64)
+    exit_reason = np.zeros((n_signals, n_drawdowns, n_stops), dtype=np.int8)
+
+    logger.info("Sweeping %d x %d grid over %d signal days...", n_drawdowns, n_stops, n_signals)
+    for i in range(n_signals):
+        drawdown_entry_price = index["signal_price"][i] * (1 - drawdowns / 100)
+        entry_offset = np.searchsorted(index["entry_key"][i], -drawdown_entry_price)
+        entered = entry_offset < index["entry_length"][i]
+        if not entered.any():
+            continue
+        rows = index["entry_start"][i] + entry_offset[entered]
+        entry_row[i, entered] = rows
+        lowest_price[i, entered] = index["hold_low"][i, entry_offset[entered]]
+
+        stop_loss_price = closes[rows][:, None] * (1 - stop_losses / 100)
+        stop_offset = np.searchsorted(index["exit_key"][i], -stop_loss_price.ravel()).reshape(stop_loss_price.shape)
+        stopped = stop_offset < index["exit_length"][i]
+        exit_row[i, entered] = np.where(stopped, index["exit_start"][i] + stop_offset, index["fallback_row"][i])
+        exit_reason[i, entered] = np.where(stopped, STOP_LOSS, index["fallback_reason"][i])
+
+    traded = exit_row >= 0
+    entry_price = np.where(entry_row >= 0, closes[entry_row], np.nan)[:, :, None]
+    exit_price = np.where(traded, closes[exit_row], np.nan)
+    trade_return = (exit_price - entry_price) / entry_price * 100
+
+    trade_count = traded.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        surface = pd.DataFrame({
+            "drawdown_level (%)": np.repeat(drawdowns, n_stops),
+            "stop_loss_level (%)": np.tile(stop_losses, n_drawdowns),
+            "signals": n_signals,
+            "trades": trade_count.ravel(),
+            "fill_rate": (trade_count / n_signals).ravel(),
+            "win_rate": ((trade_return > 0).sum(axis=0) / trade_count).ravel(),
+            "profit_target_rate": ((exit_reason == PROFIT_TARGET).sum(axis=0) / trade_count).ravel(),
+            "stop_loss_rate": ((exit_reason == STOP_LOSS).sum(axis=0) / trade_count).ravel(),
+            "mean_return (%)": (np.nansum(trade_return, axis=0) / trade_count).ravel(),
+            "total_return (%)": np.nansum(trade_return, axis=0).ravel(),
+        }, columns=SURFACE_COLUMNS)
+
+    if not with_trades:
+        return surface, None
+
+    # Walk the grid in (drawdown, stop_loss, date) order, like the per-combination backtest
+    d, s, i = np.nonzero(traded.transpose(1, 2, 0))
+    ts = _index_ns(data)
+    trades = pd.DataFrame({
+        "signal_price": index["signal_price"][i],
+        "entry_price": entry_price[i, d, 0],
+        "entry_datetime": pd.to_datetime(ts[entry_row[i, d]]),
+        "lowest_price": lowest_price[i, d],
+        "exit_price": exit_price[i, d, s],
+        "exit_datetime": pd.to_datetime(ts[exit_row[i, d, s]]),
+        "trade_return (%)": trade_return[i, d, s],
+        "drawdown_level (%)": drawdowns[d],
+        "stop_loss_level (%)": stop_losses[s],
+        "exit_reason": EXIT_REASONS[exit_reason[i, d, s]],
+    }, columns=TRADE_COLUMNS)
+    return surface, trades
+
+
+if __name__ == "__main__":
+    configure_logging()
+    with instrumentation.run(ticker_from_path(input_file)) as report:
+        data = load_data(input_file, start_date, price_columns)
+
+        logger.info("Finding signal days (gap-up open and 11:15 close above the open)...")
+        with stage("rollup"):
+            rollup = load_rollup(input_file)
+        signals = find_signals(data, rollup)
+        logger.info("Found %d signal days.", len(signals))
+
+        with stage("sweep"):
+            surface, trades = sweep(data, drawdown_levels, stop_loss_levels, signals,
+                                    with_trades=trades_output_file is not None)
+
+        with stage("output_write"):
+            surface.to_csv(surface_output_file, index=False)
+            if trades is not None:
+                trades.to_csv(trades_output_file, index=False)
+        logger.info("Return/hit-rate surface saved to '%s'.", surface_output_file)
+        if trades is not None:
+            logger.info("Trade details saved to '%s'.", trades_output_file)
+    log_reports([report])
@@ -0,0 +1,114 @@
+import argparse
+import logging
+
+import numpy as np
+import pandas as pd
+
+from daily_rollup import trading_days
+from instrumentation import configure_logging
+
+# Seeded generator of synthetic 1-minute files in the Price_Data format.
+#
+#     python synthetic_data.py SYN_2012_onward_1min_UNADJUSTED.txt --start 2013-01-01 --end 2024-12-31
+#
+# Rows are `datetime,open,high,low,close,volume` with no header, like the real
+# files, so every script can run on them.  The data has the features the
+# backtest and the cleaner care about:
+#
+#   - bars from 04:00 to 19:59 on NYSE trading days only (no weekends or
+#     exchange holidays), with every regular-session bar present except for
+#     rare dropouts, and sparse pre- and post-market bars
+#   - a few whole trading days missing, like gaps in a data feed
+#   - overnight gaps, some of them gap-ups of 0.5% or more, so signals occur
+#   - higher volatility and volume right after the open and before the close
+#   - occasional one-minute spikes between 08:00 and 08:30 (clearing candles)
+#
+# The same seed and date range always give the same file.
+
+DAY_START = pd.Timedelta(hours=4)
+MINUTES_PER_DAY = 16 * 60  # 04:00 through 19:59
+SESSION_FIRST = 5 * 60 + 30  # 09:30, in minutes after 04:00
+SESSION_LAST = 12 * 60  # 16:00
+CLEARING_FIRST = 4 * 60  # 08:00
+CLEARING_LAST = 4 * 60 + 30  # 08:30
+
+
+logger = logging.getLogger(__name__)
+
+
+def generate_bars(start, end, seed=0, start_price=100.0, annual_volatility=0.30,
+                  missing_day_rate=0.003, session_missing_rate=0.003, extended_bar_rate=0.35,
+                  gap_up_rate=0.08, spike_rate=0.05):
+    """Return a datetime-indexed open/high/low/close/volume frame for ``start`` to ``end``."""
+    rng = np.random.default_rng(seed)
+    days = trading_days(start, end)
+    days = days[rng.random(len(days)) >= missing_day_rate]
+    n_days = len(days)
+    minute = np.arange(MINUTES_PER_DAY)
+    in_session = (minute >= SESSION_FIRST) & (minute <= SESSION_LAST)
+
+    # Per-minute volatility: U-shaped in the session, quieter outside it
+    minute_vol = annual_volatility / np.sqrt(252 * 390)
+    since_open = minute - SESSION_FIRST
+    to_close = SESSION_LAST - minute
+    profile = np.where(in_session, 1.0 + 2.0 * np.exp(-since_open / 15) + 0.8 * np.exp(-to_close / 20), 0.4)
+    returns = rng.standard_normal((n_days, MINUTES_PER_DAY)) * (minute_vol * profile)
+
+    # Overnight moves land on the first minute of each day
+    overnight = rng.normal(0.0, 0.008, n_days)
+    gap_ups = rng.random(n_days) < gap_up_rate
+    overnight[gap_ups] = rng.uniform(0.005, 0.025, gap_ups.sum())
+    returns[:, 0] += overnight
+
+    closes = start_price * np.exp(np.cumsum(returns.ravel())).reshape(n_days, MINUTES_PER_DAY)
+    opens = np.concatenate([[start_price], closes.ravel()[:-1]]).reshape(n_days, MINUTES_PER_DAY)
+    wick = np.abs(rng.standard_normal((2, n_days, MINUTES_PER_DAY))) * (minute_vol * profile * 0.7)
+    highs = np.maximum(opens, closes) * np.exp(wick[0])
+    lows = np.minimum(opens, closes) * np.exp(-wick[1])
+
+    # Clearing candles: one pre-market bar far outside the recent range
+    spike_days = np.flatnonzero(rng.random(n_days) < spike_rate)
+    spike_minutes = rng.integers(CLEARING_FIRST, CLEARING_LAST + 1, len(spike_days))
+    spike_size = rng.uniform(0.01, 0.04, len(spike_days))
+    upward = rng.random(len(spike_days)) < 0.5
+    highs[spike_days[upward], spike_minutes[upward]] *= 1 + spike_size[upward]
+    lows[spike_days[~upward], spike_minutes[~upward]] *= 1 - spike_size[~upward]
+
+    present = np.where(in_session, rng.random((n_days, MINUTES_PER_DAY)) >= session_missing_rate,
+                       rng.random((n_days, MINUTES_PER_DAY)) < extended_bar_rate)
+    present[spike_days, spike_minutes] = True
+
+    volume_profile = np.where(in_session, 1.0 + 4.0 * np.exp(-since_open / 10) + 2.0 * np.exp(-to_close / 10), 0.05)
+    volumes = np.round(rng.lognormal(np.log(20000), 0.8, (n_days, MINUTES_PER_DAY)) * volume_profile) + 1
+
+    day_ns = days.values.astype("datetime64[ns]").view(np.int64)
+    stamps = day_ns[:, None] + DAY_START.value + minute * pd.Timedelta(minutes=1).value
+    opens, highs, lows, closes = (np.round(a[present], 4) for a in (opens, highs, lows, closes))
+    bars = pd.DataFrame({
+        "open": opens,
+        "high": np.maximum(highs, np.maximum(opens, closes)),
+        "low": np.minimum(lows, np.minimum(opens, closes)),
+        "close": closes,
+        "volume": volumes[present].astype(np.int64),
+    }, index=pd.DatetimeIndex(stamps[present].astype("datetime64[ns]"), name="datetime"))
+    return bars
+
+
+def write_price_file(bars, path):
+    # Same layout as the Price_Data files: no header, seconds in the timestamp
+    bars.to_csv(path, header=False, date_format="%Y-%m-%d %H:%M:%S", float_format="%.4f")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a seeded synthetic 1-minute price file.")
+    parser.add_argument("output", help="File to write, e.g. SYN_2012_onward_1min_UNADJUSTED.txt")
+    parser.add_argument("--start", default="2013-01-01")
+    parser.add_argument("--end", default="2024-12-31")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--start-price", type=float, default=100.0)
+    args = parser.parse_args()
+    configure_logging()
+
+    bars = generate_bars(args.start, args.end, seed=args.seed, start_price=args.start_price)
+    write_price_file(bars, args.output)
+    logger.info("Wrote %d bars from %s to %s to '%s'.", len(bars), bars.index[0], bars.index[-1], args.output)
@@ -0,0 +1,196 @@
+import logging
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet and Arrow output need pyarrow; CSV works without it
+    pa = pq = None
+
+# Incremental trade output with running per-combination statistics.
+#
+#     with TradeSink("trades.parquet", columns=TRADE_COLUMNS) as sink:
+#         run_backtest(data, drawdown_levels, stop_loss_levels, signals, sink=sink)
+#     sink.summary().to_csv("trades_summary.csv", index=False)
+#
+# Each batch of trades handed to `write` goes straight to disk and is then
+# dropped, so memory does not grow with the number of trades and everything
+# written before a crash is kept.  The format follows the file extension:
+#
+#     .parquet  a dataset directory with one part file per batch; every
+#               finished part stays readable after a crash
+#               (`pd.read_parquet("trades.parquet")` reads them all)
+#     .arrow    Arrow IPC stream, readable up to the last complete batch
+#     other     CSV, appended batch by batch
+#
+# A single Parquet file only becomes readable once its footer is written at
+# close, so an interrupted run would lose every batch; hence the directory.
+#
+# Without pyarrow, .parquet/.arrow paths fall back to CSV next to them.
+#
+# While writing, the sink keeps count, win rate, mean/standard deviation of the
+# return and the exit-reason mix for every (ticker, drawdown, stop_loss), so
+# `summary()` needs no second pass over the trades.
+
+GROUP_KEYS = ["ticker", "drawdown_level (%)", "stop_loss_level (%)"]
+EXIT_REASONS = ["Profit Target", "Stop-loss", "Final Exit"]
+SUMMARY_COLUMNS = GROUP_KEYS + [
+    "trades",
+    "win_rate",
+    "mean_return (%)",
+    "std_return (%)",
+    "profit_target_rate",
+    "stop_loss_rate",
+    "final_exit_rate",
+]
+
+
+logger = logging.getLogger(__name__)
+
+
+class TradeSink:
+    def __init__(self, path, columns=None):
+        self.columns = list(columns) if columns is not None else None
+        self.format = {".parquet": "parquet", ".arrow": "arrow"}.get(os.path.splitext(path)[1].lower(), "csv")
+        if self.format != "csv" and pa is None:
+            path = os.path.splitext(path)[0] + ".csv"
+            logger.warning("pyarrow is not installed, writing trades as CSV to '%s' instead.", path)
+            self.format = "csv"
+        self.path = path
+        self.rows = 0
+        self._file = None
+        self._writer = None
+        self._schema = None
+        self._parts = 0
+        self._closed = False
+        # (ticker, drawdown, stop_loss) -> [count, mean, M2, wins, profit target, stop-loss, final exit]
+        self._stats = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, trades, ticker=None):
+        """Append a batch of trades and fold it into the running statistics."""
+        if ticker is not None and "ticker" not in trades:
+            trades = trades.assign(ticker=ticker)[["ticker"] + list(trades.columns)]
+        if trades.empty:
+            return
+        if self.columns is None:
+            self.columns = list(trades.columns)
+
+        if self.format == "csv":
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._file = open(self.path, "w", newline="")
+            trades.to_csv(self._file, header=self.rows == 0, index=False)
+            self._file.flush()
+        else:
+            if self._schema is None:
+                self._schema = pa.Schema.from_pandas(trades, preserve_index=False)
+                if self.format == "parquet":
+                    self._start_dataset()
+                else:
+                    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                    self._file = pa.OSFile(self.path, "wb")
+                    self._writer = pa.ipc.new_stream(self._file, self._schema)
+            table = pa.Table.from_pandas(trades, schema=self._schema, preserve_index=False)
+            if self.format == "parquet":
+                self._write_part(table)
+            else:
+                self._writer.write_table(table)
+
+        self.rows += len(trades)
+        self._update_stats(trades)
+
+    def _start_dataset(self):
+        # Replace whatever an earlier run left at the path, file or directory
+        if os.path.isdir(self.path):
+            shutil.rmtree(self.path)
+        elif os.path.exists(self.path):
+            os.remove(self.path)
+        os.makedirs(self.path)
+
+    def _write_part(self, table):
+        # Each part is complete on disk before it appears under its final name
+        part = os.path.join(self.path, f"part-{self._parts:05d}.parquet")
+        pq.write_table(table, part + ".tmp")
+        os.replace(part + ".tmp", part)
+        self._parts += 1
+
+    def _update_stats(self, trades):
+        returns = trades["trade_return (%)"].to_numpy(dtype=float)
+        reasons = trades["exit_reason"].to_numpy()
+        batch = pd.DataFrame({
+            "ticker": trades["ticker"] if "ticker" in trades else "",
+            "drawdown_level (%)": trades["drawdown_level (%)"],
+            "stop_loss_level (%)": trades["stop_loss_level (%)"],
+            "ret": returns,
+            "win": returns > 0,
+        })
+        for reason in EXIT_REASONS:
+            batch[reason] = reasons == reason
+
+        grouped = batch.groupby(GROUP_KEYS, sort=False, dropna=False)
+        counts = grouped["ret"].count()
+        means = grouped["ret"].mean()
+        m2 = grouped["ret"].var(ddof=0) * counts
+        sums = grouped[["win"] + EXIT_REASONS].sum()
+        for key, n in counts.items():
+            # Chan et al. pairwise update of the running mean and sum of squared deviations
+            count, mean, sq, *tallies = self._stats.get(key, [0, 0.0, 0.0, 0, 0, 0, 0])
+            total = count + n
+            delta = means[key] - mean
+            mean += delta * n / total
+            sq += m2[key] + delta * delta * count * n / total
+            tallies = [t + int(v) for t, v in zip(tallies, sums.loc[key])]
+            self._stats[key] = [total, mean, sq] + tallies
+
+    def summary(self):
+        """One row per (ticker, drawdown, stop_loss) seen so far; the ticker column is dropped if never set."""
+        rows = []
+        for (ticker, drawdown, stop_loss), (count, mean, sq, wins, profit, stop, final) in self._stats.items():
+            rows.append({
+                "ticker": ticker,
+                "drawdown_level (%)": drawdown,
+                "stop_loss_level (%)": stop_loss,
+                "trades": count,
+                "win_rate": wins / count,
+                "mean_return (%)": mean,
+                "std_return (%)": np.sqrt(sq / (count - 1)) if count > 1 else np.nan,
+                "profit_target_rate": profit / count,
+                "stop_loss_rate": stop / count,
+                "final_exit_rate": final / count,
+            })
+        summary = pd.DataFrame(rows, columns=SUMMARY_COLUMNS)
+        if (summary["ticker"] == "").all():
+            summary = summary.drop(columns="ticker")
+        return summary.sort_values(by=[c for c in GROUP_KEYS if c in summary], ignore_index=True)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self.rows == 0 and self._file is None and self._writer is None:
+            # Nothing was traded: still leave a file with the column header
+            empty = pd.DataFrame(columns=self.columns or [])
+            if self.format == "csv":
+                empty.to_csv(self.path, index=False)
+            elif self.format == "parquet":
+                self._start_dataset()
+                self._write_part(pa.Table.from_pandas(empty, preserve_index=False))
+            else:
+                with pa.OSFile(self.path, "wb") as f, pa.ipc.new_stream(f, pa.Schema.from_pandas(empty, preserve_index=False)):
+                    pass
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
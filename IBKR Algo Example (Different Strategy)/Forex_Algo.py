@@ -3,150 +3,251 @@ from ibapi.wrapper import EWrapper
 from ibapi.contract import Contract
 from ibapi.order import Order
 from ibapi.contract import ContractDetails
+import collections
 import datetime
+import logging
+import logging.handlers
+import math
+import os
+import queue
+import threading
+import time
 import pytz
 
+# Currency pairs to stream; each gets its own strategy state
+PAIRS_TO_STREAM = ["USDJPY"]
+
+TIMEZONE = pytz.timezone('America/New_York')
+DEFAULT_TICK_SIZE = 0.0001  # Used until contractDetails reports the pair's minTick
+LOOKBACK = 3  # Closes kept per pair for the strategy
+BAR_REQ_ID_START = 10000
+DETAILS_REQ_ID_START = 20000
+LATENCY_SAMPLES = 10000  # Most recent bar-to-placeOrder latencies kept for the p50/p99 report
+
+# DEBUG also logs every received bar; INFO logs orders, exits and setup only
+LOG_LEVEL = os.getenv('FOREX_LOG_LEVEL', 'INFO')
+
+logger = logging.getLogger("forex_algo")
+
+
+def setup_logging(level=LOG_LEVEL):
+    # Log records are put on a queue and written to the console by a listener
+    # thread, so slow console I/O never holds up the API reader thread
+    log_queue = queue.SimpleQueue()
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(threadName)s: %(message)s"))
+    listener = logging.handlers.QueueListener(log_queue, console)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(level)
+    logger.propagate = False
+    listener.start()
+    return listener
+
+
+def make_contract(pair: str) -> Contract:
+    contract = Contract()
+    contract.symbol = pair[:3]  # Base currency
+    contract.secType = "CASH"
+    contract.currency = pair[3:]  # Quote currency
+    contract.exchange = "IDEALPRO"  # Forex exchange
+    return contract
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile of an already sorted list
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class PairState:
+    # Strategy state for one currency pair.  The last LOOKBACK closes live in a
+    # fixed-size ring buffer, so a new bar overwrites the oldest close in place.
+    __slots__ = ("symbol", "contract", "min_tick_size", "closes", "head", "count",
+                 "position", "entry_price", "entry_time")
+
+    def __init__(self, symbol: str, contract: Contract):
+        self.symbol = symbol
+        self.contract = contract
+        self.min_tick_size = DEFAULT_TICK_SIZE
+        self.closes = [0.0] * LOOKBACK
+        self.head = 0  # Slot the next close goes into
+        self.count = 0  # Closes stored so far, up to LOOKBACK
+        self.position = 0  # Track current position (1 = long, -1 = short, 0 = flat)
+        self.entry_price = None  # Store the entry price of the current position
+        self.entry_time = None  # Store the bar time (epoch seconds) of entry
+
+    def push(self, close: float):
+        self.closes[self.head] = close
+        self.head = (self.head + 1) % LOOKBACK
+        if self.count < LOOKBACK:
+            self.count += 1
+
+    def close_ago(self, n: int) -> float:
+        # n = 1 is the latest close, n = 2 the one before it, ...
+        return self.closes[(self.head - n) % LOOKBACK]
+
+
 class Forexdatastream(EWrapper, EClient):
-    def __init__(self):
+    def __init__(self, pairs_to_stream=PAIRS_TO_STREAM):
         EClient.__init__(self, self)
+        self.pairs_to_stream = list(pairs_to_stream)
         self.orderId = 0
         self.active_requests = set()
         self.reqId_to_symbol = {}  # Map to store request IDs to symbols
-        self.prices = []  # Store close prices for analysis
-        self.position = 0  # Track current position (1 = long, -1 = short, 0 = flat)
-        self.entry_price = None  # Store the entry price of the current position
-        self.entry_time = None  # Store the time of entry
-        self.min_tick_size = 0.0001  # Default tick size, dynamically updated later
+        self.states = {}  # Bar request ID -> PairState
+        self.details_requests = {}  # Contract details request ID -> PairState
+
+        # Decisions made on the reader thread are queued here and sent by the
+        # order worker thread
+        self.order_queue = queue.SimpleQueue()
+        self.latencies_ns = collections.deque(maxlen=LATENCY_SAMPLES)
+        self.order_worker = threading.Thread(target=self.run_order_worker, name="order-worker", daemon=True)
+        self.order_worker.start()
 
     def nextValidId(self, orderId: int):
         self.orderId = orderId
-        print(f"Next valid order ID: {orderId}")
-        self.req_contract_details("USDJPY")  # Request contract details to fetch tick size
+        logger.info("Next valid order ID: %s", orderId)
         self.setup_contracts()
 
     def setup_contracts(self):
-        # Define the currency pairs to stream
-        self.pairs_to_stream = ["USDJPY"]
-
-        reqId = 10000
-        for pair in self.pairs_to_stream:
-            # Set up the contract for each currency pair
-            contract = Contract()
-            contract.symbol = pair[:3]  # Base currency
-            contract.secType = "CASH"
-            contract.currency = pair[3:]  # Quote currency
-            contract.exchange = "IDEALPRO"  # Forex exchange
-
-            # Request real-time bars for the contract
-            self.reqRealTimeBars(reqId, contract, 5, "MIDPOINT", 0, [])
-            self.active_requests.add(reqId)
+        for i, pair in enumerate(self.pairs_to_stream):
+            reqId = BAR_REQ_ID_START + i
+            state = PairState(pair, make_contract(pair))
+            self.states[reqId] = state
             self.reqId_to_symbol[reqId] = pair
-            print(f"Streaming data for {pair} with request ID {reqId}")
-            reqId += 1
+
+            # Fetch the pair's tick size, then request its real-time bars
+            self.req_contract_details(state, DETAILS_REQ_ID_START + i)
+            self.reqRealTimeBars(reqId, state.contract, 5, "MIDPOINT", 0, [])
+            self.active_requests.add(reqId)
+            logger.info("Streaming data for %s with request ID %s", pair, reqId)
 
     def realtimeBar(self, reqId: int, time_stamp: int, open_: float, high: float, low: float, close: float, volume: int, wap: float, count: int):
-        # Map the request ID to the currency pair
-        symbol = self.reqId_to_symbol.get(reqId, "Unknown")
-        timezone = pytz.timezone('America/New_York')
-        current_datetime = datetime.datetime.fromtimestamp(time_stamp).astimezone(timezone)
+        received_ns = time.perf_counter_ns()
+        # Look up the state of the currency pair this request streams
+        state = self.states.get(reqId)
+        if state is None:
+            return
 
         # Log the received bar data
-        print(f"Received bar data for Ticker: {symbol}, Time: {current_datetime}, Open: {open_}, High: {high}, Low: {low}, Close: {close}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Received bar data for Ticker: %s, Time: %s, Open: %s, High: %s, Low: %s, Close: %s",
+                         state.symbol, datetime.datetime.fromtimestamp(time_stamp, TIMEZONE), open_, high, low, close)
 
-        # Add the close price to the price list
-        self.prices.append(close)
-        if len(self.prices) > 3:
-            self.prices.pop(0)  # Keep only the last 3 prices for analysis
+        # Add the close price to the pair's ring buffer
+        state.push(close)
 
         # Check for exit conditions first
-        self.check_exit_conditions(symbol, close, current_datetime)
+        self.check_exit_conditions(state, close, time_stamp, received_ns)
         # Then check for new entry conditions
-        self.check_scalping_strategy(symbol, close, current_datetime)
+        self.check_scalping_strategy(state, close, time_stamp, received_ns)
 
-    def check_scalping_strategy(self, symbol: str, close: float, current_datetime: datetime.datetime):
-        if len(self.prices) < 3:
-            return  # Not enough data yet
+    def check_scalping_strategy(self, state: PairState, close: float, time_stamp: int, received_ns: int):
+        if state.count < LOOKBACK or state.position != 0:
+            return  # Not enough data yet, or already in a position
 
         # Simple scalping logic: Buy on a dip, sell on a peak
-        if self.prices[-2] < self.prices[-3] and self.prices[-1] > self.prices[-2]:
-            if self.position == 0:  # No position
-                self.place_order(symbol, "BUY", 100000, close, current_datetime)
-                self.position = 1
-        elif self.prices[-2] > self.prices[-3] and self.prices[-1] < self.prices[-2]:
-            if self.position == 0:  # No position
-                self.place_order(symbol, "SELL", 100000, close, current_datetime)
-                self.position = -1
-
-    def check_exit_conditions(self, symbol: str, close: float, current_datetime: datetime.datetime):
-        if self.position == 0 or self.entry_price is None or self.entry_time is None:
+        last, middle, first = state.close_ago(1), state.close_ago(2), state.close_ago(3)
+        if middle < first and last > middle:
+            self.place_order(state, "BUY", 100000, close, time_stamp, received_ns)
+            state.position = 1
+        elif middle > first and last < middle:
+            self.place_order(state, "SELL", 100000, close, time_stamp, received_ns)
+            state.position = -1
+
+    def check_exit_conditions(self, state: PairState, close: float, time_stamp: int, received_ns: int):
+        if state.position == 0 or state.entry_price is None or state.entry_time is None:
             return  # No position to exit
 
-        time_elapsed = (current_datetime - self.entry_time).total_seconds()
+        time_elapsed = time_stamp - state.entry_time
 
         # Exit long position
-        if self.position == 1:
-            if close > self.entry_price or time_elapsed > 60:
-                self.place_order(symbol, "SELL", 100000, close, current_datetime)  # Exit long position
-                print(f"Exited long position for {symbol} at {close}")
-                self.position = 0
-                self.entry_price = None
-                self.entry_time = None
+        if state.position == 1:
+            if close > state.entry_price or time_elapsed > 60:
+                self.place_order(state, "SELL", 100000, close, time_stamp, received_ns)  # Exit long position
+                logger.info("Exited long position for %s at %s", state.symbol, close)
+                state.position = 0
+                state.entry_price = None
+                state.entry_time = None
 
         # Exit short position
-        elif self.position == -1:
-            if close < self.entry_price or time_elapsed > 60:
-                self.place_order(symbol, "BUY", 100000, close, current_datetime)  # Exit short position
-                print(f"Exited short position for {symbol} at {close}")
-                self.position = 0
-                self.entry_price = None
-                self.entry_time = None
-
-    def req_contract_details(self, symbol: str):
-        contract = Contract()
-        contract.symbol = symbol[:3]
-        contract.secType = "CASH"
-        contract.currency = symbol[3:]
-        contract.exchange = "IDEALPRO"
-
-        self.reqContractDetails(self.orderId, contract)
+        elif state.position == -1:
+            if close < state.entry_price or time_elapsed > 60:
+                self.place_order(state, "BUY", 100000, close, time_stamp, received_ns)  # Exit short position
+                logger.info("Exited short position for %s at %s", state.symbol, close)
+                state.position = 0
+                state.entry_price = None
+                state.entry_time = None
+
+    def req_contract_details(self, state: PairState, reqId: int):
+        # Separate request IDs per pair, so each reply updates the right tick size
+        self.details_requests[reqId] = state
+        self.reqContractDetails(reqId, state.contract)
 
     def contractDetails(self, reqId, contractDetails: ContractDetails):
         tick_size = contractDetails.minTick
-        print(f"Tick size for {contractDetails.contract.symbol}/{contractDetails.contract.currency}: {tick_size}")
-        self.min_tick_size = tick_size
-
-    def place_order(self, symbol: str, action: str, quantity: int, close: float, current_datetime: datetime.datetime):
-        contract = Contract()
-        contract.symbol = symbol[:3]  # Base currency
-        contract.secType = "CASH"
-        contract.currency = symbol[3:]  # Quote currency
-        contract.exchange = "IDEALPRO"
-
-        # Use the dynamically fetched tick size or default to 0.0001
-        tick_size = self.min_tick_size
-        rounded_price = round(close / tick_size) * tick_size
+        logger.info("Tick size for %s/%s: %s", contractDetails.contract.symbol, contractDetails.contract.currency, tick_size)
+        state = self.details_requests.get(reqId)
+        if state is not None and tick_size:
+            state.min_tick_size = tick_size
 
-        order = Order()
-        order.action = action
-        order.orderType = "LMT"  # Use limit order
-        order.totalQuantity = quantity
-        order.lmtPrice = rounded_price  # Use the rounded limit price
-        order.orderId = self.orderId
-        order.eTradeOnly = False
-        order.firmQuoteOnly = False
+    def place_order(self, state: PairState, action: str, quantity: int, close: float, time_stamp: int, received_ns: int):
+        # Use the pair's own tick size (the default until contractDetails arrives)
+        tick_size = state.min_tick_size
+        rounded_price = round(close / tick_size) * tick_size
 
-        # Place the order
-        self.placeOrder(contract, order)
-        print(f"Placed {action} limit order for {quantity} of {symbol} at {rounded_price} with order ID {self.orderId} at {current_datetime}")
-        self.orderId += 1
+        # The order worker builds and sends the order
+        self.order_queue.put((state, action, quantity, rounded_price, time_stamp, received_ns))
 
         # Track entry price and time for new positions
-        if action == "BUY" and self.position == 0:
-            self.entry_price = rounded_price
-            self.entry_time = current_datetime
-        elif action == "SELL" and self.position == 0:
-            self.entry_price = rounded_price
-            self.entry_time = current_datetime
+        if state.position == 0:
+            state.entry_price = rounded_price
+            state.entry_time = time_stamp
+
+    def run_order_worker(self):
+        # Drain the order queue until a None is queued by stop_order_worker
+        while True:
+            item = self.order_queue.get()
+            if item is None:
+                break
+            state, action, quantity, limit_price, time_stamp, received_ns = item
+
+            order = Order()
+            order.action = action
+            order.orderType = "LMT"  # Use limit order
+            order.totalQuantity = quantity
+            order.lmtPrice = limit_price  # Use the rounded limit price
+            order.orderId = self.orderId
+            order.eTradeOnly = False
+            order.firmQuoteOnly = False
+
+            # Place the order
+            try:
+                self.placeOrder(state.contract, order)
+            except Exception:
+                logger.exception("Failed to place %s order %s for %s", action, order.orderId, state.symbol)
+                continue
+            self.latencies_ns.append(time.perf_counter_ns() - received_ns)
+            logger.info("Placed %s limit order for %s of %s at %s with order ID %s at %s", action, quantity, state.symbol,
+                        limit_price, order.orderId, datetime.datetime.fromtimestamp(time_stamp, TIMEZONE))
+            self.orderId += 1
+
+    def stop_order_worker(self, timeout=5.0):
+        # Send the orders still queued, then stop the worker thread
+        self.order_queue.put(None)
+        self.order_worker.join(timeout)
+
+    def latency_stats(self):
+        """p50/p99/max bar-receipt-to-placeOrder latency in microseconds over the recent orders."""
+        samples = sorted(self.latencies_ns)
+        if not samples:
+            return {"orders": 0}
+        return {
+            "orders": len(samples),
+            "p50_us": percentile(samples, 0.50) / 1000,
+            "p99_us": percentile(samples, 0.99) / 1000,
+            "max_us": samples[-1] / 1000,
+        }
 
     def placeOrder(self, contract, order):
         """
@@ -157,6 +258,8 @@ class Forexdatastream(EWrapper, EClient):
         super().placeOrder(order.orderId, contract, order)
 
 if __name__ == "__main__":
+    listener = setup_logging()
+    app = None
     try:
         # Instantiate the Forexdatastream class
         app = Forexdatastream()
@@ -165,6 +268,11 @@ if __name__ == "__main__":
         # Run the client
         app.run()
     except KeyboardInterrupt:
-        print("Streaming stopped by user.")
+        logger.info("Streaming stopped by user.")
     except Exception as e:
-        print(f"An error occurred: {e}")
+        logger.error("An error occurred: %s", e)
+    finally:
+        if app is not None:
+            app.stop_order_worker()
+            logger.info("Order latency from bar receipt to placeOrder: %s", app.latency_stats())
+        listener.stop()
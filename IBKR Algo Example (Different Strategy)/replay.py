@@ -0,0 +1,148 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from ibapi.contract import ContractDetails
+
+import Forex_Algo
+from Forex_Algo import DEFAULT_TICK_SIZE, Forexdatastream, setup_logging
+
+# Replay stored or synthetic bars through Forexdatastream without TWS.
+#
+#     python replay.py ../Price_Data/EURUSD_2012_onward_1min_UNADJUSTED.txt
+#     python replay.py --synthetic USDJPY EURUSD --bars 2000000 --fills fills.csv
+#
+# ReplayClient is the live Forexdatastream with the broker calls replaced:
+# bar and contract detail requests are recorded, contract details are answered
+# at once with DEFAULT_TICK_SIZE (or --tick-size), and every order that reaches
+# placeOrder is filled at its limit price.  Bars go into realtimeBar as fast
+# as the strategy takes them, interleaved across pairs by time, so the same
+# callback, strategy and order-worker code as in live trading is exercised.
+#
+# Price_Data files hold 1-minute bars in New York time
+# (datetime,open,high,low,close,volume); each file is replayed as the pair
+# named by its ticker prefix.  Synthetic pairs are seeded random walks of
+# 5-second bars.
+
+
+class ReplayClient(Forexdatastream):
+    def __init__(self, pairs_to_stream, tick_size=DEFAULT_TICK_SIZE):
+        super().__init__(pairs_to_stream)
+        self.tick_size = tick_size
+        self.bar_requests = {}  # reqId -> contract
+        self.fills = []
+
+    def reqRealTimeBars(self, reqId, contract, barSize, whatToShow, useRTH, realTimeBarsOptions):
+        self.bar_requests[reqId] = contract
+
+    def reqContractDetails(self, reqId, contract):
+        details = ContractDetails()
+        details.contract = contract
+        details.minTick = self.tick_size
+        self.contractDetails(reqId, details)
+
+    def placeOrder(self, contract, order):
+        # Runs on the order-worker thread: fill the whole order at its limit price
+        self.fills.append((order.orderId, contract.symbol + contract.currency, order.action,
+                           order.totalQuantity, order.lmtPrice))
+
+
+def read_price_data(path):
+    # (epoch seconds, open, high, low, close, volume) arrays for a Price_Data file
+    data = pd.read_csv(path, header=None, names=["datetime", "open", "high", "low", "close", "volume"],
+                       parse_dates=["datetime"])
+    if not pd.api.types.is_datetime64_any_dtype(data["datetime"]):
+        raise ValueError(f"{path} is not a 1-minute price file (is it still a Git LFS pointer?)")
+    data.sort_values(by="datetime", inplace=True)
+    local = pd.DatetimeIndex(data["datetime"]).tz_localize(str(Forex_Algo.TIMEZONE), ambiguous="NaT",
+                                                              nonexistent="shift_forward")
+    keep = ~local.isna()
+    seconds = local[keep].tz_convert("UTC").tz_localize(None).values.astype("datetime64[s]").astype(np.int64)
+    return (seconds,) + tuple(data[column].to_numpy(dtype=float)[keep] for column in ["open", "high", "low", "close", "volume"])
+
+
+def synthetic_bars(pair, bars, seed, start="2024-01-02 00:00", volatility=0.00005):
+    # Seeded random walk of 5-second midpoint bars
+    rng = np.random.default_rng(seed)
+    start_price = 150.0 if pair.endswith("JPY") else 1.1
+    first = int(pd.Timestamp(start, tz=str(Forex_Algo.TIMEZONE)).timestamp())
+    seconds = first + 5 * np.arange(bars, dtype=np.int64)
+    steps = rng.normal(0.0, volatility, size=(bars, 4))
+    close = start_price * np.exp(np.cumsum(steps[:, 3]))
+    open_ = np.concatenate([[start_price], close[:-1]])
+    high = np.maximum(open_, close) * np.exp(np.abs(steps[:, 1]))
+    low = np.minimum(open_, close) * np.exp(-np.abs(steps[:, 2]))
+    return seconds, open_, high, low, close, np.zeros(bars)
+
+
+def replay(app, streams):
+    """Feed every pair's bars into ``app.realtimeBar`` in time order.
+
+    ``streams`` maps each request ID to its (seconds, open, high, low, close,
+    volume) arrays.  Returns the number of bars fed and the wall time taken.
+    """
+    req_ids = np.concatenate([np.full(len(arrays[0]), reqId) for reqId, arrays in streams.items()])
+    columns = [np.concatenate([arrays[i] for arrays in streams.values()]) for i in range(6)]
+    order = np.argsort(columns[0], kind="stable")
+    req_ids = req_ids[order].tolist()
+    seconds, open_, high, low, close, volume = (column[order].tolist() for column in columns)
+
+    realtime_bar = app.realtimeBar
+    started = time.perf_counter()
+    for bar in zip(req_ids, seconds, open_, high, low, close, volume):
+        realtime_bar(*bar, 0.0, 0)
+    elapsed = time.perf_counter() - started
+    return len(req_ids), elapsed
+
+
+def fill_summary(fills, last_close):
+    # Fills per pair and profit/loss in the quote currency, marking any open
+    # position to the pair's last close
+    fills = pd.DataFrame(fills, columns=["order_id", "pair", "action", "quantity", "price"])
+    fills["signed_quantity"] = np.where(fills["action"] == "BUY", fills["quantity"], -fills["quantity"])
+    rows = []
+    for pair, group in fills.groupby("pair", sort=True):
+        position = group["signed_quantity"].sum()
+        cash = -(group["signed_quantity"] * group["price"]).sum()
+        rows.append({"pair": pair, "fills": len(group), "open_position": position,
+                     "pnl": cash + position * last_close.get(pair, np.nan)})
+    return fills.drop(columns="signed_quantity"), pd.DataFrame(rows, columns=["pair", "fills", "open_position", "pnl"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay bars through the Forex strategy without a broker connection.")
+    parser.add_argument("files", nargs="*", help="Price_Data-format files, one pair per file")
+    parser.add_argument("--synthetic", nargs="*", default=[], metavar="PAIR",
+                        help="Also replay seeded synthetic 5-second bars for these pairs")
+    parser.add_argument("--bars", type=int, default=1_000_000, help="Synthetic bars per pair (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tick-size", type=float, default=DEFAULT_TICK_SIZE,
+                        help="minTick reported for every pair (default: %(default)s)")
+    parser.add_argument("--fills", default=None, help="Write every fill to this CSV")
+    parser.add_argument("--log-level", default="WARNING", help="Strategy log level during the replay (default: %(default)s)")
+    args = parser.parse_args()
+    if not args.files and not args.synthetic:
+        parser.error("give Price_Data files and/or --synthetic pairs")
+
+    sources = {}
+    for path in args.files:
+        sources[os.path.basename(path).split("_")[0]] = read_price_data(path)
+    for i, pair in enumerate(args.synthetic):
+        sources[pair] = synthetic_bars(pair, args.bars, args.seed + i)
+
+    listener = setup_logging(args.log_level)
+    app = ReplayClient(list(sources), tick_size=args.tick_size)
+    app.nextValidId(1)
+    streams = {reqId: sources[state.symbol] for reqId, state in app.states.items()}
+    bars, elapsed = replay(app, streams)
+    app.stop_order_worker(timeout=None)
+    listener.stop()
+
+    fills, summary = fill_summary(app.fills, {pair: arrays[4][-1] for pair, arrays in sources.items() if len(arrays[4])})
+    if args.fills:
+        fills.to_csv(args.fills, index=False)
+    print(summary.to_string(index=False))
+    print(f"Replayed {bars} bars across {len(sources)} pairs in {elapsed:.2f}s ({bars / elapsed:,.0f} bars/sec)")
+    print(f"Bar receipt to placeOrder latency: {app.latency_stats()}")